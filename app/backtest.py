@@ -0,0 +1,153 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from app import config
+from app.monitor import create_monitor, needs_retrain, update_monitor
+from app.rebuild import build_history
+from app.train import fit_new_model, re_train_model
+from app.transformer import load_transformer
+
+
+_FEATURES = None
+
+
+def as_loaded(model: xgb.XGBRegressor)->xgb.XGBRegressor:
+    """
+    Reproduce el modelo que obtiene `load_model` al leer el archivo guardado en producción.
+
+    Al guardar y cargar el modelo solo se conserva el booster, así que los reentrenamientos posteriores usan los
+    parámetros por defecto de `XGBRegressor`; se reproduce lo mismo para que cada estrategia se evalúe como se
+    ejecutaría en producción.
+
+    Parámetros:
+    -----------
+    model : xgb.XGBRegressor
+        El modelo entrenado.
+
+    Retorna:
+    --------
+    xgb.XGBRegressor
+        Un modelo con el mismo booster, limitado a un hilo porque las estrategias se ejecutan en procesos paralelos.
+    """
+    loaded = xgb.XGBRegressor(n_jobs=1)
+    loaded.load_model(bytearray(model.get_booster().save_raw('json')))
+    return loaded
+
+
+def fit_initial_model(history: pd.DataFrame)->xgb.XGBRegressor:
+    """
+    Entrena desde cero un modelo con `fit_new_model`, es decir, con los hiperparámetros de `config.MODEL_PARAMS`
+    elegidos en el notebook y con los que se entrenó el modelo de producción.
+
+    Parámetros:
+    -----------
+    history : pd.DataFrame
+        DataFrame semanal con 'Valor neto' y las características del modelo.
+
+    Retorna:
+    --------
+    xgb.XGBRegressor
+        El modelo entrenado, tal como lo cargaría `load_model`. Se limita a un hilo porque las estrategias se
+        ejecutan en procesos paralelos.
+    """
+    return as_loaded(fit_new_model(history, n_jobs=1))
+
+
+def run_strategy(strategy: str, features: pd.DataFrame = None)->dict:
+    """
+    Reproduce la historia semana a semana con una estrategia de reentrenamiento.
+
+    Para cada semana se predice el valor neto con el modelo entrenado hasta la semana anterior, se registra el
+    error y luego se aplica la estrategia con el valor real observado:
+    - 'sin_reentrenar': nunca se reentrena el modelo inicial.
+    - 'semanal': se continúa el entrenamiento con cada semana nueva, como lo hacía `train_model`.
+    - 'monitor': se continúa el entrenamiento con las semanas pendientes solo cuando el monitor de drift lo pide.
+    - 'desde_cero': se entrena un modelo nuevo con toda la historia disponible cada semana.
+
+    Parámetros:
+    -----------
+    strategy : str
+        El nombre de la estrategia.
+
+    features : pd.DataFrame, opcional
+        La matriz semanal de `build_history`. Si no se indica, se usa la matriz cargada en el proceso.
+
+    Retorna:
+    --------
+    dict
+        Diccionario con la estrategia, el RMSE, el MAE, el número de reentrenamientos y el tiempo en segundos.
+    """
+    features = _FEATURES if features is None else features
+    start = time.perf_counter()
+    rows = load_transformer().to_matrix(features)
+    target = features['Valor neto'].to_numpy(dtype=float)
+    first_week = config.BACKTEST_MIN_WEEKS
+    model = fit_initial_model(features.iloc[:first_week])
+    state = create_monitor(features.iloc[:first_week], model) if strategy == 'monitor' else None
+    pending = first_week
+    retrains = 0
+    predictions = []
+    for week in range(first_week, len(features)):
+        predictions.append(float(model.get_booster().inplace_predict(rows[week:week + 1])[0]))
+        if strategy == 'semanal':
+            model = as_loaded(re_train_model(model, features.iloc[week:week + 1]))
+            retrains += 1
+        elif strategy == 'desde_cero':
+            model = fit_initial_model(features.iloc[:week + 1])
+            retrains += 1
+        elif strategy == 'monitor':
+            state = update_monitor(state, features.iloc[week:week + 1], model)
+            if needs_retrain(state):
+                model = as_loaded(re_train_model(model, features.iloc[pending:week + 1]))
+                state = create_monitor(features.iloc[:week + 1], model, state['historial_residuales'])
+                pending = week + 1
+                retrains += 1
+        elif strategy != 'sin_reentrenar':
+            raise ValueError(f'Estrategia desconocida: {strategy}')
+    errors = target[first_week:] - np.asarray(predictions)
+    return {
+        'Estrategia': strategy,
+        'RMSE': float(np.sqrt(np.mean(errors ** 2))),
+        'MAE': float(np.mean(np.abs(errors))),
+        'Reentrenamientos': retrains,
+        'Tiempo (s)': time.perf_counter() - start,
+    }
+
+
+def _init_worker(features: pd.DataFrame):
+    global _FEATURES
+    _FEATURES = features
+
+
+def backtest(strategies: list = None, workers: int = None)->pd.DataFrame:
+    """
+    Ejecuta el backtest walk-forward de las estrategias de reentrenamiento en procesos paralelos.
+
+    La matriz de características se construye una sola vez y se envía a cada proceso al iniciarlo.
+
+    Parámetros:
+    -----------
+    strategies : list, opcional
+        Las estrategias a evaluar. Por defecto, `config.BACKTEST_STRATEGIES`.
+
+    workers : int, opcional
+        El número de procesos. Por defecto, el mínimo entre el número de estrategias y de núcleos.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame indexado por estrategia con el RMSE, el MAE, el número de reentrenamientos y el tiempo.
+    """
+    strategies = strategies or config.BACKTEST_STRATEGIES
+    workers = workers or min(len(strategies), os.cpu_count())
+    features = build_history()
+    if len(features) <= config.BACKTEST_MIN_WEEKS:
+        raise ValueError(f'Se necesitan más de {config.BACKTEST_MIN_WEEKS} semanas para el backtest')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(features,)) as executor:
+        results = list(executor.map(run_strategy, strategies))
+    return pd.DataFrame(results).set_index('Estrategia')
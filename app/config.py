@@ -4,6 +4,27 @@ DATABASE_ROOT_PATH = str(Path(__file__).parent / "database")
 MODEL_ROOT_PATH = str(Path(__file__).parent / "model")
 CSV_NAME = 'Facturacion.xlsx'
 DATA_WEEK = 'data_week.xlsx' 
+TRANSFORMER_NAME = 'transformer.json'
+TRM_NAME = 'trm.csv'
+EXPLANATIONS_NAME = 'explanations.json'
+MONITOR_NAME = 'monitor.json'
+
+MONITOR_BINS = 5
+MONITOR_DECAY = 0.95
+MONITOR_PSI = 0.5
+MONITOR_KS = 0.4
+MONITOR_ERROR_RATIO = 1.5
+MONITOR_RESIDUAL_WEEKS = 20
+
+MODEL_PARAMS = {'objective': 'reg:squarederror', 'n_estimators': 400, 'max_depth': 5, 'learning_rate': 0.1, 'subsample': 0.8,
+                'colsample_bytree': 1.0, 'gamma': 0.1, 'reg_alpha': 0.5, 'reg_lambda': 1}
+
+MEMORY_BUDGET = None
+
+BACKTEST_MIN_WEEKS = 52
+BACKTEST_STRATEGIES = ['sin_reentrenar', 'semanal', 'monitor', 'desde_cero']
+TRM_MAX_DAYS = 5
+TRM_URL = 'https://www.datos.gov.co/resource/32sa-8pi3.csv'
 
 ASEGURADORA = ['alianza medellin antioquia','allianz seguros de vida','axa colpatria seguros','colmedica prepagada','colsanitas med prepagada','compania mundial de segurossa','coomeva medicina prepagada','coosalud entidad promotora de','empresas publicas','fund hosp san vicente de paul','nueva empresa promotora de salu','particulares','salud total','seguros de vida suramericana','seguros de vida suramericana polizas global o cla','seguros del estado soat','seguros generales suramericana soat','sura']
 
@@ -1,9 +1,21 @@
+import itertools
+import os
 import re
+import urllib.parse
+import zipfile
 
+import numpy as np
+import openpyxl
 import pandas as pd
 import unidecode
 
-import config
+from app import config
+from app.transformer import load_transformer
+
+
+_TRM_CACHE = {}
+
+CATEGORICAL_COLUMNS = ['Aseguradora', 'Población', 'Género', 'Clase episodio', 'Centro de Responsabilidad']
 
 
 class TrainError(Exception):
@@ -12,6 +24,232 @@ class TrainError(Exception):
         super().__init__(self.message)
 
 
+class TRMError(Exception):
+    def __init__(self, message="Missing TRM for USD records"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class MemoryBudgetError(Exception):
+    def __init__(self, message="Memory budget exceeded"):
+        self.message = message
+        super().__init__(self.message)
+
+
+def frame_size(data: pd.DataFrame)->float:
+    """
+    Calcula la memoria que ocupa un DataFrame o una Serie, incluyendo el contenido de las columnas de texto.
+
+    Retorna:
+    --------
+    float
+        El tamaño del DataFrame en MB.
+    """
+    return np.sum(data.memory_usage(deep=True)) / 2**20
+
+
+def check_memory(stage: str, *frames: pd.DataFrame, report: bool = True):
+    """
+    Reporta la memoria que ocupan los DataFrames vivos en una etapa y verifica que no supere el presupuesto.
+
+    Se suman todos los DataFrames que están en memoria al mismo tiempo en la etapa (por ejemplo, los registros
+    completos y la codificación one-hot de un bloque), no solo el resultado de la etapa.
+    Si `config.MEMORY_BUDGET` es None no se realiza ninguna verificación.
+
+    Parámetros:
+    -----------
+    stage : str
+        El nombre de la etapa del pipeline.
+
+    *frames : pd.DataFrame
+        Los DataFrames que están en memoria al mismo tiempo en la etapa.
+
+    report : bool, opcional
+        Si es False, solo se verifica el presupuesto sin imprimir el reporte.
+
+    Lanza:
+    ------
+    MemoryBudgetError
+        Si la suma de los tamaños supera `config.MEMORY_BUDGET`.
+    """
+    if config.MEMORY_BUDGET is None:
+        return
+    size = sum(frame_size(frame) for frame in frames)
+    if report:
+        print(f'Memoria en la etapa {stage}: {size:.1f} MB de {config.MEMORY_BUDGET} MB')
+    if size > config.MEMORY_BUDGET:
+        message = f'La etapa {stage} ocupa {size:.1f} MB y supera el presupuesto de {config.MEMORY_BUDGET} MB'
+        raise MemoryBudgetError(message)
+
+
+def compact_types(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Convierte las columnas de un DataFrame a tipos compactos sin perder información.
+
+    Las columnas categóricas conocidas y las columnas de texto con algún valor se convierten a `category`, los
+    enteros se reducen al menor tipo entero que contiene todos sus valores y los flotantes se convierten a float32
+    solo si todos sus valores se representan exactamente.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        El DataFrame cargado.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        El DataFrame con los tipos compactos.
+    """
+    for column in data.columns:
+        values = data[column]
+        if column in CATEGORICAL_COLUMNS or (values.dtype == object and values.notna().any()):
+            data[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            data[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype) and values.dtype != np.float32:
+            compact = values.astype(np.float32)
+            if np.array_equal(compact.to_numpy(dtype=np.float64), values.to_numpy(), equal_nan=True):
+                data[column] = compact
+    return data
+
+
+def apply_to_categories(column: pd.Series, function)->pd.Series:
+    """
+    Aplica una transformación de texto sobre los valores únicos de una columna categórica.
+
+    La transformación se evalúa una sola vez por categoría y el resultado se reparte a todas las filas con
+    los códigos de la columna, en lugar de evaluarla fila por fila. Los valores faltantes también pasan por la
+    transformación, igual que al aplicarla fila por fila (por ejemplo, `reduce_dimentionality` los convierte en
+    'Otro'). Si la columna no es categórica, la transformación se aplica directamente.
+
+    Parámetros:
+    -----------
+    column : pd.Series
+        La columna que se desea transformar.
+
+    function : callable
+        Función que recibe una Serie de valores y retorna una Serie con los valores transformados.
+
+    Retorna:
+    --------
+    pd.Series
+        La columna transformada, categórica si la columna original lo era.
+    """
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        return function(column)
+    categories = pd.Series(list(column.cat.categories) + [np.nan], dtype=object)
+    categories = function(categories).to_numpy(dtype=object)
+    values = categories[column.cat.codes.to_numpy()]
+    return pd.Series(values, index=column.index, name=column.name).astype('category')
+
+
+def excel_cell(value):
+    """
+    Convierte el valor de una celda como lo hace `pd.read_excel`: los números enteros guardados como flotantes
+    se leen como enteros.
+    """
+    if type(value) is float and value.is_integer():
+        return int(value)
+    return value
+
+
+def concat_compact(blocks: list)->pd.DataFrame:
+    """
+    Une bloques con tipos compactos conservando las columnas categóricas.
+
+    Los bloques se unen columna por columna: cada columna se retira de los bloques a medida que se une, así que
+    en memoria solo conviven los bloques, las columnas ya unidas y la columna que se está uniendo, en lugar de
+    una copia completa de todos los bloques como con `pd.concat`. Las categorías de cada columna categórica se
+    unifican entre bloques antes de unirlos, porque `pd.concat` convierte a texto las columnas categóricas con
+    categorías distintas. Las columnas que quedaron con otro tipo en algún bloque (por ejemplo, un bloque sin
+    valores) se vuelven a compactar al final.
+
+    Parámetros:
+    -----------
+    blocks : list
+        Lista de DataFrames con las mismas columnas y los tipos de `compact_types`. Los bloques quedan vacíos.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame con todos los registros y tipos compactos.
+
+    Lanza:
+    ------
+    MemoryBudgetError
+        Si la unión de alguna columna no cabe en `config.MEMORY_BUDGET`.
+    """
+    columns = {}
+    for column in list(blocks[0].columns):
+        pieces = [block.pop(column) for block in blocks]
+        if all(isinstance(piece.dtype, pd.CategoricalDtype) for piece in pieces):
+            values = pd.concat([pd.Series(piece.cat.categories) for piece in pieces])
+            categories = pd.Categorical(values.drop_duplicates()).categories
+            pieces = [piece.cat.set_categories(categories) for piece in pieces]
+        check_memory('Carga', *blocks, *columns.values(), *pieces, *pieces, report=False)
+        columns[column] = pd.concat(pieces, ignore_index=True)
+        del pieces
+    data = pd.DataFrame(columns, copy=False)
+    del columns
+    return compact_types(data.infer_objects(copy=False))
+
+
+def read_excel(path: str)->pd.DataFrame:
+    """
+    Lee la primera hoja de un archivo Excel y compacta sus tipos con `compact_types`.
+
+    Sin presupuesto de memoria se usa `pd.read_excel`. Con `config.MEMORY_BUDGET`, la hoja se lee por bloques de
+    filas en modo de solo lectura y cada bloque se compacta apenas se lee, de modo que la tabla en bruto nunca
+    está completa en memoria. Igual que en `week_chunks`, se cuentan una sola vez los datos que siguen vivos (los
+    bloques compactos) más el bloque en bruto que se está leyendo, y los bloques se unen al final columna por
+    columna con `concat_compact`, sin duplicarlos. Cada bloque en bruto usa como máximo la mitad de la memoria
+    libre, y nunca menos de la vigésima parte del presupuesto, para no multiplicar el costo de las categorías
+    de cada bloque.
+
+    Parámetros:
+    -----------
+    path : str
+        La ruta del archivo Excel.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Un DataFrame con los datos del archivo y tipos compactos.
+
+    Lanza:
+    ------
+    MemoryBudgetError
+        Si los datos no caben en `config.MEMORY_BUDGET`.
+    """
+    if config.MEMORY_BUDGET is None:
+        return compact_types(pd.read_excel(path))
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows)
+        blocks = []
+        block_rows = 100
+        while True:
+            block = [tuple(excel_cell(value) for value in row) for row in itertools.islice(rows, block_rows)]
+            if not block:
+                break
+            raw = pd.DataFrame.from_records(block, columns=header)
+            del block
+            check_memory('Carga', raw, *blocks, report=False)
+            row_size = frame_size(raw) / len(raw)
+            blocks.append(compact_types(raw))
+            del raw
+            available = config.MEMORY_BUDGET - sum(frame_size(compact) for compact in blocks)
+            block_rows = max(int(config.MEMORY_BUDGET / 20 / row_size), int(available / 2 / row_size), 1)
+    finally:
+        workbook.close()
+    if not blocks:
+        return pd.DataFrame(columns=header)
+    data = concat_compact(blocks)
+    check_memory('Carga', data)
+    return data
+
+
 def charge_data(is_dataset:bool = False)->pd.DataFrame:
     """
     Carga un archivo Excel desde una ruta especificada en la configuración.
@@ -26,13 +264,15 @@ def charge_data(is_dataset:bool = False)->pd.DataFrame:
     Retorna:
     --------
     pandas.DataFrame
-        Un DataFrame de pandas que contiene los datos cargados desde el archivo Excel correspondiente.
+        Un DataFrame de pandas que contiene los datos cargados desde el archivo Excel correspondiente, con los 
+        tipos compactos de `compact_types`. Si hay presupuesto de memoria, el archivo se lee por bloques con
+        `read_excel`.
     """
     root = config.DATABASE_ROOT_PATH
     name = config.CSV_NAME
     if is_dataset:
         name = config.DATA_WEEK
-    return pd.read_excel(f'{root}/{name}')
+    return read_excel(f'{root}/{name}')
 
 
 def charge_last_data()->pd.DataFrame:
@@ -80,8 +320,7 @@ def verify_last_data(data_week: pd.DataFrame, data_billing: pd.DataFrame)->pd.Da
         - Si no hay nuevas fechas en `data_billing` en comparación con `data_week`, devuelve `False`.
         - Si hay nuevas fechas, devuelve un DataFrame con los registros de los últimos 4 semanas desde la fecha más temprana de esas nuevas fechas.
     """
-    data = data_billing.copy()
-    data = data.set_index("Creado el")
+    data = data_billing.set_index("Creado el")
     df_week = data.resample("W").count()
     new_dates = df_week.index.difference(data_week.index)
     if new_dates.empty:
@@ -108,13 +347,14 @@ def extract_data_4_train_model_process()-> pd.DataFrame:
         Si hay nuevos datos, devuelve los registros de facturación más recientes que serán utilizados
         para el entrenamiento del modelo.
     """
+    data_billing = charge_data()
+    data_billing = data_billing.sort_values(by="Creado el", ascending=True)
     data_week = charge_data(True)
     data_week = data_week.set_index("Creado el")
     data_week = data_week.sort_index(ascending=True)
-    data_billing = charge_data()
-    data_billing = data_billing.sort_values(by="Creado el", ascending=True)
+    check_memory('Extracción', data_billing, data_week)
     new_data_exist = verify_last_data(data_week, data_billing)
-    if not new_data_exist:
+    if new_data_exist is False:
         message = 'El modelo está actualizado con la última información'
         raise TrainError(message)
     return new_data_exist
@@ -255,12 +495,14 @@ def clean_insurance(data: pd.DataFrame)->pd.DataFrame:
     pd.DataFrame
         El DataFrame original con la columna 'Aseguradora' limpiada y normalizada.
     """
-    data['Aseguradora'] = data['Aseguradora'].apply(normalize_insurer)
-    data['Aseguradora'] = data['Aseguradora'].apply(clean_text)
-    data['Aseguradora'] = data['Aseguradora'].replace(r'\b(sa|sas)\b', '', regex=True)
-    data['Aseguradora'] = data['Aseguradora'].replace(r'\b(s|a)\b', '', regex=True)
-    data['Aseguradora'] = data['Aseguradora'].replace(r'\b(eps|epss)\b', '', regex=True)
-    data['Aseguradora'] = data['Aseguradora'].apply(clean_text)
+    def clean(insurers: pd.Series)->pd.Series:
+        insurers = insurers.apply(normalize_insurer)
+        insurers = insurers.apply(clean_text)
+        insurers = insurers.replace(r'\b(sa|sas)\b', '', regex=True)
+        insurers = insurers.replace(r'\b(s|a)\b', '', regex=True)
+        insurers = insurers.replace(r'\b(eps|epss)\b', '', regex=True)
+        return insurers.apply(clean_text)
+    data['Aseguradora'] = apply_to_categories(data['Aseguradora'], clean)
     return data
 
 
@@ -283,35 +525,167 @@ def clean_pobl(data:pd.DataFrame)->pd.DataFrame:
     pd.DataFrame
         El DataFrame original con la columna 'Población' limpiada y normalizada.
     """
-    data['Población'] = data['Población'].apply(clean_text)
-    data['Población'] = data['Población'].replace(r'\b(dc)\b', '', regex=True)
-    data['Población'] = data['Población'].replace(r'\b(d|c)\b', '', regex=True)
-    data['Población'] = data['Población'].replace(r'\b(el|la)\b', '', regex=True)
-    data['Población'] = data['Población'].apply(clean_text)
-    data['Población'] = data['Población'].apply(normalize_city)
+    def clean(cities: pd.Series)->pd.Series:
+        cities = cities.apply(clean_text)
+        cities = cities.replace(r'\b(dc)\b', '', regex=True)
+        cities = cities.replace(r'\b(d|c)\b', '', regex=True)
+        cities = cities.replace(r'\b(el|la)\b', '', regex=True)
+        cities = cities.apply(clean_text)
+        return cities.apply(normalize_city)
+    data['Población'] = apply_to_categories(data['Población'], clean)
+    return data
+
+
+def clean_age(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Convierte la columna 'Edad' de un DataFrame a valores numéricos.
+
+    La conversión con `convert_to_number` se evalúa una sola vez por cada valor distinto de la columna y el
+    resultado se reparte a todas las filas, en lugar de evaluarla fila por fila.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        El DataFrame que contiene la columna 'Edad' en sus diferentes formatos (12, 12 A, 12 D o una hora).
+
+    Retorna:
+    --------
+    pd.DataFrame
+        El DataFrame original con la columna 'Edad' convertida a números.
+    """
+    codes, values = pd.factorize(data['Edad'], use_na_sentinel=False)
+    ages = np.array([convert_to_number(value) for value in values])
+    data['Edad'] = pd.to_numeric(pd.Series(ages[codes], index=data.index), downcast='integer')
+    return data
+
+
+def clean_text_column(data: pd.DataFrame, column: str)->pd.DataFrame:
+    """
+    Limpia con `clean_text` una columna de texto de un DataFrame.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        El DataFrame que contiene la columna a limpiar.
+
+    column : str
+        El nombre de la columna, por ejemplo 'Clase episodio'.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        El DataFrame original con la columna limpiada, evaluando `clean_text` una vez por categoría con
+        `apply_to_categories`.
+    """
+    data[column] = apply_to_categories(data[column], lambda values: values.apply(clean_text))
     return data
 
 
+def charge_trm()->pd.DataFrame:
+    """
+    Carga la tabla histórica de TRM desde el archivo CSV especificado en la configuración.
+
+    La tabla se mantiene en memoria entre llamadas y solo se vuelve a leer si el archivo cambia en disco.
+    Los registros se ordenan por fecha y, si hay fechas repetidas, se conserva la última versión.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Un DataFrame con las columnas 'Fecha' y 'TRM' ordenado de forma ascendente por 'Fecha'.
+    """
+    path = f'{config.DATABASE_ROOT_PATH}/{config.TRM_NAME}'
+    modified = os.path.getmtime(path)
+    cached = _TRM_CACHE.get(path)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+    trm = pd.read_csv(path, parse_dates=['Fecha'])
+    trm = trm.sort_values(by='Fecha', kind='stable')
+    trm = trm.drop_duplicates(subset='Fecha', keep='last').reset_index(drop=True)
+    _TRM_CACHE[path] = (modified, trm)
+    return trm
+
+
+def update_trm(start: str = '2022-01-01')->pd.DataFrame:
+    """
+    Descarga la serie oficial de TRM diaria desde `config.TRM_URL` (datos abiertos de la Superintendencia
+    Financiera) y la guarda en el archivo CSV especificado en la configuración.
+
+    Cada TRM se registra en la fecha desde la que está vigente. Los registros de la tabla actual desde `start`
+    en adelante se reemplazan completos por la serie descargada, de modo que no quedan valores aproximados
+    mezclados con los oficiales; los registros anteriores a `start` se conservan.
+
+    Parámetros:
+    -----------
+    start : str, opcional
+        La fecha desde la que se descarga la serie, en formato AAAA-MM-DD.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        La tabla de TRM guardada, con las columnas 'Fecha' y 'TRM' ordenada por 'Fecha'.
+    """
+    query = urllib.parse.urlencode({
+        '$select': 'vigenciadesde,valor',
+        '$where': f"vigenciadesde >= '{start}T00:00:00'",
+        '$order': 'vigenciadesde',
+        '$limit': 100000,
+    })
+    downloaded = pd.read_csv(f'{config.TRM_URL}?{query}', parse_dates=['vigenciadesde'])
+    downloaded = downloaded.rename(columns={'vigenciadesde': 'Fecha', 'valor': 'TRM'})
+    downloaded['Fecha'] = downloaded['Fecha'].dt.normalize()
+    path = f'{config.DATABASE_ROOT_PATH}/{config.TRM_NAME}'
+    trm = charge_trm() if os.path.exists(path) else pd.DataFrame(columns=['Fecha', 'TRM'])
+    trm = pd.concat([trm[trm['Fecha'] < pd.Timestamp(start)], downloaded[['Fecha', 'TRM']]], ignore_index=True)
+    trm.to_csv(path, index=False, date_format='%Y-%m-%d')
+    return charge_trm()
+
+
 def convert_trm(data: pd.DataFrame)->pd.DataFrame:
     """
-    Convierte el valor neto de los registros en USD a la moneda local utilizando el TRM.
+    Convierte el valor neto de los registros en USD a la moneda local utilizando la TRM vigente en la fecha del registro.
 
     Esta función toma un DataFrame que contiene una columna llamada 'Mon.' que indica la moneda de los registros y una columna 
-    llamada 'Valor neto'. Si la moneda es USD, se convierte el valor neto multiplicándolo por el TRM (Tasa de Representación del 
-    Mercado). El valor por defecto de la TRM es 4000.
+    llamada 'Valor neto'. Si la moneda es USD, se convierte el valor neto multiplicándolo por la TRM (Tasa de Representación del 
+    Mercado) de la tabla histórica cargada con `charge_trm`. A cada registro se le asigna la última TRM publicada en o antes 
+    de su fecha 'Creado el' mediante una búsqueda ordenada sobre toda la columna. Si algún registro en USD es anterior a la 
+    primera TRM de la tabla, o su fecha supera en más de `config.TRM_MAX_DAYS` días a la última, no se usa ningún valor 
+    por defecto y se lanza un `TRMError` para que se complete la tabla.
 
     Parámetros:
     -----------
     data : pd.DataFrame
-        El DataFrame que contiene las columnas 'Mon.' (moneda) y 'Valor neto' (valor en la moneda indicada).
+        El DataFrame que contiene las columnas 'Mon.' (moneda) y 'Valor neto' (valor en la moneda indicada), y la fecha 
+        'Creado el' como columna o como índice.
     
     Retorna:
     --------
     pd.DataFrame
         El DataFrame actualizado con los valores de 'Valor neto' convertidos a la moneda local si la moneda original es USD.
+        La columna 'Valor neto' siempre queda en float64, haya o no registros en USD.
+
+    Lanza:
+    ------
+    TRMError
+        Si la tabla de TRM no cubre la fecha de algún registro en USD.
     """
-    TRM = 4000
-    data.loc[data['Mon.'] == 'USD', 'Valor neto'] *= TRM
+    is_usd = (data['Mon.'] == 'USD').to_numpy()
+    factor = np.ones(len(data))
+    if is_usd.any():
+        dates = data['Creado el'] if 'Creado el' in data.columns else data.index
+        dates = pd.DatetimeIndex(dates)[is_usd].to_numpy()
+        trm = charge_trm()
+        trm_dates = trm['Fecha'].to_numpy()
+        position = trm_dates.searchsorted(dates, side='right') - 1
+        uncovered = position < 0
+        if len(trm_dates):
+            uncovered |= dates >= trm_dates[-1] + np.timedelta64(config.TRM_MAX_DAYS + 1, 'D')
+        if uncovered.any():
+            missing = pd.DatetimeIndex(dates[uncovered])
+            message = (f'La tabla {config.TRM_NAME} no cubre {uncovered.sum()} registros en USD entre el '
+                       f'{missing.min().date()} y el {missing.max().date()}. Agregue las TRM de esas fechas')
+            raise TRMError(message)
+        factor[is_usd] = trm['TRM'].to_numpy(dtype=float)[position]
+    data['Valor neto'] = data['Valor neto'] * factor
     return data
 
 
@@ -320,11 +694,11 @@ def pre_process_new_data(new_data: pd.DataFrame)->pd.DataFrame:
     Preprocesa un DataFrame de datos nuevos, realizando varias transformaciones y limpieza de columnas.
 
     Esta función aplica una serie de pasos de preprocesamiento a los datos contenidos en el DataFrame `new_data`:
-    1. Convierte la columna 'Edad' a valores numéricos.
+    1. Convierte la columna 'Edad' a valores numéricos con `clean_age`.
     2. Limpia la columna 'Aseguradora' aplicando normalización y eliminación de texto innecesario.
-    3. Limpia la columna 'Clase episodio' eliminando texto adicional.
+    3. Limpia la columna 'Clase episodio' eliminando texto adicional con `clean_text_column`.
     4. Normaliza y limpia los nombres de las ciudades en la columna 'Población'.
-    5. Convierte los valores de 'Valor neto' en la moneda USD a la moneda local utilizando el TRM (4000).
+    5. Convierte los valores de 'Valor neto' en la moneda USD a la moneda local utilizando la TRM histórica.
     6. Elimina las columnas 'Mon.', 'Causa Externa', y 'Pais de Nacimiento'.
 
     Parámetros:
@@ -343,9 +717,9 @@ def pre_process_new_data(new_data: pd.DataFrame)->pd.DataFrame:
     pd.DataFrame
         El DataFrame preprocesado con las transformaciones y limpiezas aplicadas.
     """
-    new_data['Edad'] = new_data['Edad'].apply(convert_to_number)
+    new_data = clean_age(new_data)
     new_data = clean_insurance(new_data)
-    new_data['Clase episodio'] = new_data['Clase episodio'].apply(clean_text)
+    new_data = clean_text_column(new_data, 'Clase episodio')
     new_data = clean_pobl(new_data)
     new_data = convert_trm(new_data)
     columns_t_delete = ['Mon.', 'Causa Externa', 'Pais de Nacimiento']
@@ -378,8 +752,8 @@ def reduce_dimentionality(data: pd.DataFrame)-> pd.DataFrame:
         El DataFrame con las columnas 'Población' y 'Aseguradora' transformadas, donde los valores no presentes
         en las listas predefinidas son reemplazados por 'Otro'.
     """
-    data['Población'] = data['Población'].apply(lambda x: x if x in config.POBLACION else 'Otro')
-    data['Aseguradora'] = data['Aseguradora'].apply(lambda x: x if x in config.ASEGURADORA else 'Otro')
+    data['Población'] = apply_to_categories(data['Población'], lambda values: values.apply(lambda x: x if x in config.POBLACION else 'Otro'))
+    data['Aseguradora'] = apply_to_categories(data['Aseguradora'], lambda values: values.apply(lambda x: x if x in config.ASEGURADORA else 'Otro'))
     return data
 
 
@@ -390,7 +764,8 @@ def generate_one_hot_encoding(data: pd.DataFrame)->pd.DataFrame:
 
     Esta función toma un DataFrame `data` y transforma varias columnas categóricas mediante la codificación one-hot, 
     de modo que cada valor único de una columna se convierte en una columna nueva con valores binarios. 
-    El nombre de cada nueva columna comienza con un prefijo que identifica la columna original.
+    El nombre de cada nueva columna comienza con un prefijo que identifica la columna original y sus valores se
+    almacenan como uint8.
 
     Parámetros:
     -----------
@@ -405,7 +780,7 @@ def generate_one_hot_encoding(data: pd.DataFrame)->pd.DataFrame:
     """
     columns = {'Población':'Poblacion', 'Aseguradora':'Aseguradora', 'Género':'Genero', 'Centro de Responsabilidad':'centro', 'Clase episodio':'Episodio'}
     for column, prefix in columns.items():
-        data = pd.concat([data, pd.get_dummies(data[column], prefix=prefix)], axis=1)
+        data = pd.concat([data, pd.get_dummies(data[column], prefix=prefix, dtype=np.uint8)], axis=1)
     data = data.drop(columns=columns.keys())
     return data
 
@@ -427,12 +802,15 @@ def group_by_week(data:pd.DataFrame)->pd.DataFrame:
     --------
     pd.DataFrame
         Un nuevo DataFrame con los datos agregados por semana, donde se ha calculado la media para la columna 'Edad'
-        (convertida a enteros) y la suma para el resto de las columnas.
+        (convertida a enteros) y la suma para el resto de las columnas. Los conteos de las columnas one-hot se 
+        almacenan como int32.
     """
     mean_columns = ['Edad']
     agg_dict = {col: 'mean' if col in mean_columns else 'sum' for col in data.columns}
+    counts = [col for col in data.columns if data[col].dtype == np.uint8]
     data_week = data.resample('W').agg(agg_dict)
     data_week['Edad'] = data_week['Edad'].astype(int)
+    data_week = data_week.astype({col: np.int32 for col in counts})
     return data_week
 
 
@@ -493,12 +871,11 @@ def windowing(data_week: pd.DataFrame)->pd.DataFrame:
     
 def complete_all_columns(data_week: pd.DataFrame)->pd.DataFrame:
     """
-    Completa las columnas faltantes en un DataFrame semanal con valores cero.
+    Completa y ordena las columnas de un DataFrame semanal según el transformador guardado junto al modelo.
 
-    La función asegura que el DataFrame `data_week` contenga todas las columnas esperadas,
-    basadas en configuraciones predefinidas de poblaciones, aseguradoras, géneros, centros
-    de responsabilidad y clases de episodio. Si alguna columna esperada no está presente
-    en `data_week`, se agrega con un valor de 0 en todas las filas.
+    La función asegura que el DataFrame `data_week` contenga exactamente las columnas esperadas por el modelo,
+    en el mismo orden y con los mismos tipos, usando los vocabularios congelados del transformador. Si alguna
+    columna esperada no está presente en `data_week`, se agrega con un valor de 0 en todas las filas.
 
     Parámetros:
     -----------
@@ -509,20 +886,10 @@ def complete_all_columns(data_week: pd.DataFrame)->pd.DataFrame:
     Retorna:
     --------
     pd.DataFrame
-        DataFrame actualizado con todas las columnas esperadas. Las columnas que estaban
-        ausentes se añaden con valores cero.
-    """
-    POBLACION = ['Freq_Poblacion' + nombre for nombre in config.POBLACION]
-    ASEGURADORA = ['Freq_Aseguradora' + nombre for nombre in config.ASEGURADORA]
-    GENERO = ['Freq' + nombre for nombre in config.GENERO]
-    CENTRO_RESPONSABILIDAD = ['Freq' + nombre for nombre in config.CENTRO_RESPONSABILIDAD]
-    CLASE_EPISODIO = ['Freq' + nombre for nombre in config.CLASE_EPISODIO]
-    TOTAL = POBLACION + ASEGURADORA + GENERO + CENTRO_RESPONSABILIDAD + CLASE_EPISODIO
-    columns = set(data_week.columns)
-    for column in TOTAL:
-        if column not in columns:
-            data_week[column] = 0
-    return data_week    
+        DataFrame actualizado con 'Valor neto' y todas las columnas esperadas en el orden del modelo. Las columnas 
+        que estaban ausentes se añaden con valores cero.
+    """
+    return load_transformer().align(data_week)
 
 
 def save_last_registers(data: pd.DataFrame)->pd.DataFrame:
@@ -553,37 +920,243 @@ def save_last_registers(data: pd.DataFrame)->pd.DataFrame:
     rest_registers = data[data.index > max_date]
     data_week = pd.concat([data_week, rest_registers])
     data_week= data_week[~data_week.index.duplicated(keep='first')]
-    data_week.to_excel(f'{config.DATABASE_ROOT_PATH}/{config.DATA_WEEK}')
+    save_data_week(data_week)
     return rest_registers
+
+
+def save_data_week(data_week: pd.DataFrame):
+    """
+    Guarda los datos semanales en el archivo de Excel especificado en la configuración.
+
+    Parámetros:
+    -----------
+    data_week : pd.DataFrame
+        DataFrame semanal indexado por 'Creado el' con 'Valor neto' y las características del modelo.
+    """
+    data_week.index.name = 'Creado el'
+    path = f'{config.DATABASE_ROOT_PATH}/{config.DATA_WEEK}'
+    data_week.to_excel(path)
+    stamp = data_week.index.max() if len(data_week) else pd.Timestamp('1980-01-01')
+    pin_workbook(path, stamp)
+
+
+def pin_workbook(path: str, stamp: pd.Timestamp):
+    """
+    Fija las marcas de tiempo de un libro de Excel para que su contenido binario dependa solo de los datos.
+
+    openpyxl escribe la fecha actual en las propiedades `created`/`modified` del libro y en cada entrada del
+    archivo zip, por lo que dos libros con los mismos datos nunca coinciden byte a byte. Esta función reescribe
+    el archivo con esas fechas fijadas en `stamp`, de modo que la reconstrucción completa y la ingesta
+    incremental producen archivos idénticos.
+
+    Parámetros:
+    -----------
+    path : str
+        Ruta del archivo .xlsx que se desea reescribir.
+
+    stamp : pd.Timestamp
+        Fecha que se usa en las propiedades del libro y en las entradas del zip (normalmente la última semana).
+    """
+    stamp = max(pd.Timestamp(stamp), pd.Timestamp('1980-01-01'))
+    date_time = stamp.timetuple()[:6]
+    core = stamp.strftime('%Y-%m-%dT%H:%M:%SZ').encode()
+    with zipfile.ZipFile(path) as archive:
+        entries = [(info.filename, archive.read(info)) for info in archive.infolist()]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            if name == 'docProps/core.xml':
+                content = re.sub(rb'(<dcterms:(?:created|modified)[^>]*>)[^<]*', rb'\g<1>' + core, content)
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o600 << 16
+            archive.writestr(info, content)
     
 
-def process_new_data(data: pd.DataFrame)->pd.DataFrame:
+def week_labels(index: pd.DatetimeIndex)->np.ndarray:
+    """
+    Calcula a qué semana de `resample('W')` pertenece cada fecha.
+
+    Las semanas van del lunes al domingo completos, igual que en `group_by_week`.
+
+    Parámetros:
+    -----------
+    index : pd.DatetimeIndex
+        Las fechas de los registros.
+
+    Retorna:
+    --------
+    np.ndarray
+        Un array con el número de semana de cada fecha, contado desde el domingo 4 de enero de 1970.
+    """
+    days = (index.floor('D') - pd.Timestamp('1970-01-04')).days.to_numpy()
+    return -(-days // 7)
+
+
+def split_by_week(data: pd.DataFrame, rows: int):
     """
-    Procesa los nuevos datos semanales para un modelo predictivo, incluyendo reducción de dimensionalidad,
-    codificación one-hot, agrupación semanal, cálculo de ventanas móviles y completado de columnas faltantes.
-    Los registros procesados se guardan, evitando duplicados.
+    Divide los registros en bloques contiguos de semanas completas.
+
+    Cada bloque empieza en la primera semana que no cabe en el bloque anterior de `rows` registros, de modo que
+    ninguna semana quede repartida entre dos bloques y la agrupación semanal de cada bloque sea exacta.
 
     Parámetros:
     -----------
     data : pd.DataFrame
-        DataFrame con los nuevos datos a procesar, donde cada fila representa un registro de datos
-        y cada columna corresponde a una característica relevante para el modelo.
+        DataFrame indexado por 'Creado el'.
+
+    rows : int
+        El número aproximado de registros por bloque.
+
+    Retorna:
+    --------
+    generator
+        Un generador con los bloques del DataFrame en orden cronológico.
+    """
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index()
+    weeks = week_labels(data.index)
+    starts = np.flatnonzero(np.r_[True, np.diff(weeks) != 0])
+    bounds = starts[np.flatnonzero(np.diff(starts // rows)) + 1]
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(data)]):
+        yield data.iloc[start:end]
+
+
+def week_chunks(data: pd.DataFrame):
+    """
+    Divide los registros pre-procesados en bloques de semanas completas que caben en el presupuesto de memoria.
+
+    Se estima el tamaño que tendrá la codificación one-hot (el DataFrame original más una columna uint8 por
+    categoría). Si cabe en `config.MEMORY_BUDGET`, o no hay presupuesto, se retorna un único bloque. De lo
+    contrario, se divide con `split_by_week` en bloques con el máximo número de registros que cabe.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        DataFrame pre-procesado e indexado por 'Creado el'.
+
+    Retorna:
+    --------
+    generator
+        Un generador con los bloques del DataFrame.
+
+    Lanza:
+    ------
+    MemoryBudgetError
+        Si ni siquiera un registro cabe en el presupuesto.
+    """
+    if config.MEMORY_BUDGET is None or data.empty:
+        yield data
+        return
+    columns = ['Población', 'Aseguradora', 'Género', 'Centro de Responsabilidad', 'Clase episodio']
+    dummies = sum(len(data[column].cat.categories) if isinstance(data[column].dtype, pd.CategoricalDtype)
+                  else data[column].nunique() for column in columns)
+    size = data.memory_usage(deep=True).sum()
+    row_size = size / len(data) + dummies
+    available = config.MEMORY_BUDGET * 2**20 - size
+    if row_size * len(data) <= available:
+        yield data
+        return
+    rows = int(available // row_size)
+    if rows < 1:
+        raise MemoryBudgetError('No hay memoria disponible para la codificación one-hot')
+    print(f'La codificación one-hot no cabe en el presupuesto, se procesa por bloques de {rows} registros')
+    yield from split_by_week(data, rows)
+
+
+def group_chunk_by_week(data: pd.DataFrame, *alive: pd.DataFrame)->pd.DataFrame:
+    """
+    Codifica con one-hot un bloque de semanas completas y lo agrupa por semana.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        Bloque de registros pre-procesados, con la dimensionalidad ya reducida, indexado por 'Creado el'.
+
+    *alive : pd.DataFrame
+        Los DataFrames que siguen en memoria mientras se codifica el bloque, como los registros completos y los
+        bloques ya agrupados, que se suman al verificar el presupuesto.
 
     Retorna:
     --------
     pd.DataFrame
-        Un DataFrame con los registros nuevos procesados y guardados, correspondiente a aquellos
-        con fechas posteriores a los registros actuales en `data_week`.
+        El bloque agrupado por semana con `group_by_week`.
     """
-    data = reduce_dimentionality(data)
     data = generate_one_hot_encoding(data)
-    new_data_week = group_by_week(data)
+    check_memory('One-hot', data, *alive)
+    return group_by_week(data)
+
+
+def finish_week_features(weeks: list)->pd.DataFrame:
+    """
+    Une los bloques agrupados por semana y calcula las características finales del modelo.
+
+    Los bloques se concatenan en orden cronológico; las columnas one-hot que no aparecen en algún bloque y las
+    semanas sin registros entre bloques se completan con cero. Luego se calculan las ventanas móviles, la semana
+    del año y el mes, y se ordenan las columnas según el transformador.
+
+    Parámetros:
+    -----------
+    weeks : list
+        Lista de DataFrames semanales generados por `group_chunk_by_week`, sin semanas repetidas entre ellos.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame indexado por semana con 'Valor neto' y las características en el orden del modelo.
+    """
+    new_data_week = pd.concat(weeks).fillna(0).asfreq('W', fill_value=0)
+    check_memory('Semanal', new_data_week, *weeks)
     new_data_week = windowing(new_data_week)
     new_data_week = delete_old_columns(new_data_week)
-    new_data_week = complete_all_columns(new_data_week)
     new_data_week['Semana'] = new_data_week.index.isocalendar().week
     new_data_week['Mes'] = new_data_week.index.month
-    new_data_week = pd.get_dummies(new_data_week, columns=['Mes'])
+    new_data_week = pd.get_dummies(new_data_week, columns=['Mes'], dtype=np.uint8)
+    new_data_week = complete_all_columns(new_data_week)
+    return new_data_week
+
+
+def build_week_features(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Construye las características semanales del modelo a partir de los registros pre-procesados, incluyendo 
+    reducción de dimensionalidad, codificación one-hot, agrupación semanal, cálculo de ventanas móviles y 
+    completado de columnas faltantes. Si hay un presupuesto de memoria y la codificación one-hot no cabe en él,
+    la codificación y la agrupación se realizan por bloques de semanas completas con `week_chunks`.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        DataFrame pre-procesado e indexado por 'Creado el', donde cada fila representa un registro de facturación.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame indexado por semana con 'Valor neto' y las características en el orden del modelo.
+    """
+    data = reduce_dimentionality(data)
+    weeks = []
+    for chunk in week_chunks(data):
+        weeks.append(group_chunk_by_week(chunk, data, *weeks))
+    return finish_week_features(weeks)
+
+
+def process_new_data(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Procesa los nuevos datos semanales para un modelo predictivo construyendo sus características con 
+    `build_week_features`. Los registros procesados se guardan, evitando duplicados.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        DataFrame con los nuevos datos a procesar, donde cada fila representa un registro de datos
+        y cada columna corresponde a una característica relevante para el modelo.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame con los registros nuevos procesados y guardados, correspondiente a aquellos
+        con fechas posteriores a los registros actuales en `data_week`.
+    """
+    new_data_week = build_week_features(data)
     rest_registers = save_last_registers(new_data_week)
     return rest_registers
     
@@ -595,6 +1168,7 @@ def load_data(train_model = False):
             new_data = extract_data_4_train_model_process()
             print('Se comienza a pre-procesar la información')
             new_data = pre_process_new_data(new_data)
+            check_memory('Pre-procesado', new_data)
             print('Se comienza a procesar la información')
             new_data = process_new_data(new_data)
             print('La nueva data ha sido guardada ')
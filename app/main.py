@@ -1,7 +1,13 @@
 import argparse
 
-from app.data_processing import load_data
-from app.predict import predict
+import numpy as np
+
+from app import config
+from app.backtest import backtest
+from app.data_processing import TrainError, load_data, update_trm
+from app.monitor import monitor_new_data, monitor_report, pending_data, reset_monitor
+from app.predict import explain, explain_interactions, predict
+from app.rebuild import rebuild
 from app.train import train_model
 
 
@@ -9,20 +15,76 @@ def main():
     parser = argparse.ArgumentParser(description="Aplicativo para predicción semanal de ingresos")
     parser.add_argument('--entrenar', action='store_true', help="Reentrenar el modelo")
     parser.add_argument('--predecir', action='store_true', help="Predecir")
+    parser.add_argument('--explicar', action='store_true', help="Predecir y explicar el aporte de cada variable")
+    parser.add_argument('--monitor', action='store_true', help="Mostrar el reporte de drift y error del modelo")
+    parser.add_argument('--backtest', action='store_true', help="Evaluar las estrategias de reentrenamiento semana a semana")
+    parser.add_argument('--rebuild', action='store_true', help="Regenerar los datos semanales desde toda la historia de facturación")
+    parser.add_argument('--forzar', action='store_true', help="Reentrenar aunque no se superen los umbrales de drift")
+    parser.add_argument('--actualizar-trm', action='store_true', help="Descargar la TRM oficial diaria a database/trm.csv")
+    parser.add_argument('--interacciones', action='store_true', help="Incluir interacciones entre variables al explicar")
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help="Presupuesto de memoria en MB para los DataFrames del procesamiento")
     args = parser.parse_args()
+    config.MEMORY_BUDGET = args.memory_budget
 
     if args.entrenar:
         print('Se va a reentrenar el modelo...')
-        data = load_data(True)
-        train_model(data)
-        print('Entrenamiento finalizado!')
+        try:
+            data = load_data(True)
+        except TrainError:
+            if not args.forzar:
+                raise
+            print('No hay información nueva de facturación, se reentrena con las semanas pendientes.')
+            data = None
+        if (data is not None and monitor_new_data(data)) or args.forzar:
+            pending = pending_data()
+            if pending.empty:
+                print('No hay semanas pendientes por entrenar, el modelo está actualizado.')
+            else:
+                train_model(pending)
+                reset_monitor()
+                print('Entrenamiento finalizado!')
+        else:
+            print('No se detectó drift ni aumento del error, no es necesario reentrenar.')
+            print(monitor_report())
     elif args.predecir:
         print('Se va a realizar una predicción con la última información añadida')
         data = load_data()
         predict_val_neto = predict(data)
         print(f"Predicción realizada: {predict_val_neto}")
+    elif args.explicar:
+        print('Se va a explicar la predicción con la última información añadida')
+        data = load_data()
+        explanation = explain(data)
+        for week, row in explanation.iterrows():
+            print(f"Semana {week.date()} - Predicción realizada: {row['Predicción']}")
+            contributions = row.drop(['Predicción', 'Sesgo'])
+            contributions = contributions.reindex(contributions.abs().sort_values(ascending=False).index)
+            print(f"Valor base del modelo: {row['Sesgo']}")
+            print(contributions.head(10).to_string())
+        if args.interacciones:
+            for week, values in explain_interactions(data).items():
+                values = values.drop(index='Sesgo', columns='Sesgo')
+                pairs = values.where(np.triu(np.ones(values.shape, dtype=bool), k=1)).stack()
+                pairs = pairs.reindex(pairs.abs().sort_values(ascending=False).index)
+                pairs.index = [f'{first} x {second}' for first, second in pairs.index]
+                print(f"Semana {week.date()} - Interacciones más fuertes:")
+                print(pairs.head(10).to_string())
+    elif args.monitor:
+        print(monitor_report())
+    elif args.rebuild:
+        print('Se van a regenerar los datos semanales con toda la historia de facturación')
+        data_week = rebuild()
+        print(f'Se guardaron {len(data_week)} semanas')
+    elif args.actualizar_trm:
+        trm = update_trm()
+        print(f"Se guardaron {len(trm)} TRM hasta el {trm['Fecha'].max().date()}")
+    elif args.backtest:
+        print('Se va a evaluar cada estrategia de reentrenamiento sobre la historia de facturación')
+        results = backtest()
+        print(results.to_string())
     else:
-        print("Por favor, especifica una acción: --entrenar o --predecir.")
+        print("Por favor, especifica una acción: --entrenar, --predecir, --explicar, --monitor, --backtest, --rebuild o --actualizar-trm.")
         
         
 
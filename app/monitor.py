@@ -0,0 +1,455 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from app import config
+from app.data_processing import charge_data
+from app.train import fit_new_model, load_model
+from app.transformer import load_transformer
+
+
+def monitored_columns(model: xgb.XGBRegressor)->list:
+    """
+    Obtiene las características del modelo sobre las que se vigila el drift.
+
+    Se excluyen las variables de calendario ('Semana' y 'Mes_*') porque cambian cada semana por definición.
+
+    Parámetros:
+    -----------
+    model : xgb.XGBRegressor
+        El modelo cargado de XGBoost.
+
+    Retorna:
+    --------
+    list
+        Lista con los nombres de las características monitoreadas, en el orden del modelo.
+    """
+    return [column for column in model.get_booster().feature_names
+            if column != 'Semana' and not column.startswith('Mes_')]
+
+
+def model_residuals(model: xgb.XGBRegressor, data: pd.DataFrame)->np.ndarray:
+    """
+    Calcula los residuales (valor real menos predicción) del modelo sobre los datos semanales.
+
+    Parámetros:
+    -----------
+    model : xgb.XGBRegressor
+        El modelo cargado de XGBoost.
+
+    data : pd.DataFrame
+        DataFrame semanal que contiene 'Valor neto' y las características del modelo. Las características
+        one-hot ausentes se completan con cero.
+
+    Retorna:
+    --------
+    np.ndarray
+        Un array con un residual por semana.
+    """
+    rows = load_transformer().to_matrix(data)
+    return data['Valor neto'].to_numpy(dtype=float) - model.get_booster().inplace_predict(rows)
+
+
+def quantile_edges(values: np.ndarray)->list:
+    """
+    Calcula los bordes de los intervalos del histograma a partir de los cuantiles de los valores de referencia.
+
+    Los bordes incluyen el mínimo y el máximo de la referencia, de modo que los valores por fuera del rango de
+    referencia caen en intervalos propios. Así una variable constante en la referencia (por ejemplo una
+    aseguradora que nunca apareció) registra drift en cuanto toma otro valor.
+
+    Parámetros:
+    -----------
+    values : np.ndarray
+        Los valores de la ventana de referencia.
+
+    Retorna:
+    --------
+    list
+        Lista ordenada y sin duplicados con el mínimo, los cuantiles internos y el máximo de la referencia.
+    """
+    quantiles = np.linspace(0, 1, config.MONITOR_BINS + 1)
+    return np.unique(np.quantile(values, quantiles)).tolist()
+
+
+def bin_positions(edges: list, values)->np.ndarray:
+    """
+    Calcula el intervalo en el que cae cada valor según los bordes de `quantile_edges`.
+
+    El primer intervalo recibe los valores menores al mínimo de la referencia y el segundo los iguales al
+    mínimo. Cada intervalo siguiente va de un borde (excluido) al siguiente (incluido), y el último recibe los
+    valores mayores al máximo de la referencia.
+
+    Parámetros:
+    -----------
+    edges : list
+        Los bordes calculados con `quantile_edges`.
+
+    values : float o np.ndarray
+        El valor o los valores a ubicar.
+
+    Retorna:
+    --------
+    np.ndarray
+        La posición del intervalo de cada valor, entre 0 y len(edges) + 1.
+    """
+    values = np.asarray(values, dtype=float)
+    return np.searchsorted(edges, values, side='left') + (values >= edges[0])
+
+
+def histogram(values: np.ndarray, edges: list)->np.ndarray:
+    """
+    Cuenta cuántos valores caen en cada intervalo definido por `edges`.
+
+    Parámetros:
+    -----------
+    values : np.ndarray
+        Los valores a contar.
+
+    edges : list
+        Los bordes calculados con `quantile_edges`.
+
+    Retorna:
+    --------
+    np.ndarray
+        Un array con len(edges) + 2 conteos, incluyendo los intervalos por debajo del mínimo y por encima del
+        máximo de la referencia.
+    """
+    return np.bincount(bin_positions(edges, values), minlength=len(edges) + 2).astype(float)
+
+
+def psi(reference: np.ndarray, current: np.ndarray)->float:
+    """
+    Calcula el índice de estabilidad poblacional (PSI) entre dos histogramas con los mismos intervalos.
+
+    Se suma medio conteo a cada intervalo antes de normalizar, porque los intervalos por fuera del rango de
+    referencia siempre están vacíos en la referencia y un valor extremo aislado dispararía el PSI.
+    """
+    reference = (reference + 0.5) / (reference.sum() + 0.5 * len(reference))
+    current = (current + 0.5) / (current.sum() + 0.5 * len(current))
+    return float(np.sum((current - reference) * np.log(current / reference)))
+
+
+def ks(reference: np.ndarray, current: np.ndarray)->float:
+    """
+    Calcula el estadístico de Kolmogorov-Smirnov entre dos histogramas con los mismos intervalos.
+    """
+    return float(np.max(np.abs(np.cumsum(reference / reference.sum()) - np.cumsum(current / current.sum()))))
+
+
+def summarize(name: str, values: np.ndarray)->dict:
+    """
+    Construye el resumen de referencia de una variable.
+
+    La ventana actual se inicia con la misma distribución de la referencia escalada al peso que alcanza el
+    decaimiento exponencial en estado estable, de modo que cada semana nueva desplaza la distribución de forma
+    gradual y no se requiere un periodo de calentamiento.
+
+    Parámetros:
+    -----------
+    name : str
+        Nombre de la variable.
+
+    values : np.ndarray
+        Valores de la variable en la ventana de referencia.
+
+    Retorna:
+    --------
+    dict
+        Diccionario con los bordes, los conteos de referencia y los conteos actuales.
+    """
+    edges = quantile_edges(values)
+    reference = histogram(values, edges)
+    current = reference / reference.sum() / (1 - config.MONITOR_DECAY)
+    return {'nombre': name, 'bordes': edges, 'referencia': reference.tolist(), 'actual': current.tolist()}
+
+
+def holdout_residuals(model: xgb.XGBRegressor, history: pd.DataFrame)->np.ndarray:
+    """
+    Estima los residuales fuera de muestra del modelo reservando las últimas semanas de la ventana de entrenamiento.
+
+    Se entrena un modelo con `fit_new_model` sobre la ventana sin sus últimas `config.MONITOR_RESIDUAL_WEEKS`
+    semanas (o la mitad de la ventana si es más corta) y se calculan sus residuales sobre las semanas reservadas.
+    Si la ventana tiene una sola semana, se retornan los residuales del modelo sobre esa semana.
+
+    Parámetros:
+    -----------
+    model : xgb.XGBRegressor
+        El modelo cargado de XGBoost, del que se toma el número de hilos.
+
+    history : pd.DataFrame
+        DataFrame semanal ordenado por fecha con los datos con los que se entrenó el modelo.
+
+    Retorna:
+    --------
+    np.ndarray
+        Un array con un residual por semana reservada.
+    """
+    weeks = min(config.MONITOR_RESIDUAL_WEEKS, len(history) // 2)
+    if weeks == 0:
+        return model_residuals(model, history)
+    holdout = fit_new_model(history.iloc[:-weeks], model.get_params()['n_jobs'])
+    return model_residuals(holdout, history.iloc[-weeks:])
+
+
+def create_monitor(history: pd.DataFrame, model: xgb.XGBRegressor, residuals: list = None)->dict:
+    """
+    Crea el estado del monitor a partir de la ventana de entrenamiento.
+
+    La referencia del error y de la distribución de los residuales se construye con residuales fuera de
+    muestra, porque los residuales del modelo sobre las semanas con las que se entrenó son casi cero y harían
+    que la razón de error superara el umbral desde la primera semana nueva. Se usan los residuales que el
+    monitor registró al predecir cada semana antes de entrenar con ella y, si no alcanzan
+    `config.MONITOR_RESIDUAL_WEEKS`, se completan con `holdout_residuals`.
+
+    Parámetros:
+    -----------
+    history : pd.DataFrame
+        DataFrame semanal indexado por fecha con los datos con los que se entrenó el modelo.
+
+    model : xgb.XGBRegressor
+        El modelo cargado de XGBoost.
+
+    residuals : list, opcional
+        Los residuales fuera de muestra registrados por el monitor anterior, en orden cronológico.
+
+    Retorna:
+    --------
+    dict
+        El estado del monitor con los resúmenes de cada variable, de los residuales, del error absoluto medio
+        y el historial de residuales fuera de muestra.
+    """
+    history = history.sort_index()
+    residuals = list(residuals or [])
+    if len(residuals) < config.MONITOR_RESIDUAL_WEEKS:
+        residuals = holdout_residuals(model, history).tolist() + residuals
+    residuals = np.asarray(residuals[-config.MONITOR_RESIDUAL_WEEKS:], dtype=float)
+    reference_mae = float(np.mean(np.abs(residuals)))
+    features = history.reindex(columns=monitored_columns(model), fill_value=0).astype(float)
+    weight = 1 / (1 - config.MONITOR_DECAY)
+    return {
+        'ultimo_entrenamiento': str(history.index.max()),
+        'ultima_semana': str(history.index.max()),
+        'variables': [summarize(column, features[column].to_numpy()) for column in features.columns],
+        'residuales': summarize('Residuales', residuals),
+        'error': {'referencia': reference_mae, 'acumulado': reference_mae * weight, 'peso': weight},
+        'historial_residuales': residuals.tolist(),
+    }
+
+
+def update_monitor(state: dict, new_weeks: pd.DataFrame, model: xgb.XGBRegressor)->dict:
+    """
+    Actualiza de forma incremental el estado del monitor con las semanas nuevas.
+
+    Cada semana nueva decae los conteos actuales y suma un conteo en el intervalo correspondiente de cada
+    variable, por lo que el costo por semana es proporcional al número de variables. Los residuales de las
+    semanas nuevas se calculan antes de entrenar con ellas, así que se agregan al historial de residuales
+    fuera de muestra. Las semanas que ya fueron incorporadas al monitor se ignoran.
+
+    Parámetros:
+    -----------
+    state : dict
+        El estado del monitor.
+
+    new_weeks : pd.DataFrame
+        DataFrame semanal indexado por fecha con las semanas nuevas, incluyendo 'Valor neto'.
+
+    model : xgb.XGBRegressor
+        El modelo cargado de XGBoost, usado para calcular los residuales de las semanas nuevas.
+
+    Retorna:
+    --------
+    dict
+        El estado del monitor actualizado.
+    """
+    new_weeks = new_weeks.sort_index()
+    new_weeks = new_weeks[new_weeks.index > pd.Timestamp(state['ultima_semana'])]
+    if new_weeks.empty:
+        return state
+    residuals = model_residuals(model, new_weeks)
+    features = new_weeks.reindex(columns=[summary['nombre'] for summary in state['variables']], fill_value=0)
+    features = features.to_numpy(dtype=float)
+    decay = config.MONITOR_DECAY
+    error = state['error']
+    for row, residual in zip(features, residuals):
+        for summary, value in zip(state['variables'] + [state['residuales']], np.append(row, residual)):
+            current = np.asarray(summary['actual']) * decay
+            current[bin_positions(summary['bordes'], value)] += 1
+            summary['actual'] = current.tolist()
+        error['acumulado'] = error['acumulado'] * decay + abs(residual)
+        error['peso'] = error['peso'] * decay + 1
+    history = state.get('historial_residuales', []) + residuals.tolist()
+    state['historial_residuales'] = history[-config.MONITOR_RESIDUAL_WEEKS:]
+    state['ultima_semana'] = str(new_weeks.index.max())
+    return state
+
+
+def drift_report(state: dict)->pd.DataFrame:
+    """
+    Calcula el PSI y el estadístico KS de cada variable y de los residuales frente a la ventana de entrenamiento.
+
+    Parámetros:
+    -----------
+    state : dict
+        El estado del monitor.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        DataFrame indexado por variable con las columnas 'PSI' y 'KS', ordenado de mayor a menor PSI.
+    """
+    rows = {}
+    for summary in state['variables'] + [state['residuales']]:
+        reference = np.asarray(summary['referencia'])
+        current = np.asarray(summary['actual'])
+        rows[summary['nombre']] = {'PSI': psi(reference, current), 'KS': ks(reference, current)}
+    report = pd.DataFrame.from_dict(rows, orient='index')
+    return report.sort_values(by='PSI', ascending=False)
+
+
+def error_ratio(state: dict)->float:
+    """
+    Calcula la razón entre el error absoluto medio reciente y el error absoluto medio fuera de muestra de referencia.
+    """
+    error = state['error']
+    if error['referencia'] == 0:
+        return 0.0
+    return error['acumulado'] / error['peso'] / error['referencia']
+
+
+def needs_retrain(state: dict)->bool:
+    """
+    Indica si el drift o el error superan los umbrales definidos en la configuración.
+
+    Parámetros:
+    -----------
+    state : dict
+        El estado del monitor.
+
+    Retorna:
+    --------
+    bool
+        True si alguna variable supera `config.MONITOR_PSI` o `config.MONITOR_KS`, o si la razón de error
+        supera `config.MONITOR_ERROR_RATIO`.
+    """
+    report = drift_report(state)
+    drift = (report['PSI'] > config.MONITOR_PSI).any() or (report['KS'] > config.MONITOR_KS).any()
+    return bool(drift or error_ratio(state) > config.MONITOR_ERROR_RATIO)
+
+
+def charge_monitor()->dict:
+    """
+    Carga el estado del monitor desde la ruta especificada en la configuración.
+
+    Retorna:
+    --------
+    dict or None
+        El estado del monitor, o None si aún no se ha creado.
+    """
+    path = f'{config.DATABASE_ROOT_PATH}/{config.MONITOR_NAME}'
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_monitor(state: dict):
+    """
+    Guarda el estado del monitor en un archivo JSON en la ruta especificada en la configuración.
+    """
+    path = f'{config.DATABASE_ROOT_PATH}/{config.MONITOR_NAME}'
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False)
+
+
+def charge_weeks()->pd.DataFrame:
+    """
+    Carga los datos semanales almacenados, indexados y ordenados por 'Creado el'.
+    """
+    data_week = charge_data(True)
+    data_week = data_week.set_index("Creado el")
+    return data_week.sort_index(ascending=True)
+
+
+def monitor_new_data(new_weeks: pd.DataFrame)->bool:
+    """
+    Incorpora las semanas nuevas al monitor y decide si es necesario reentrenar el modelo.
+
+    Si el monitor no existe, se crea tomando como ventana de entrenamiento las semanas almacenadas anteriores
+    a las semanas nuevas. Si no hay semanas anteriores, se crea con las semanas nuevas y se pide reentrenar.
+
+    Parámetros:
+    -----------
+    new_weeks : pd.DataFrame
+        DataFrame semanal indexado por fecha con las semanas nuevas procesadas.
+
+    Retorna:
+    --------
+    bool
+        True si el drift o el error superan los umbrales configurados.
+    """
+    model = load_model(True)
+    state = charge_monitor()
+    if state is None:
+        data_week = charge_weeks()
+        history = data_week[data_week.index < new_weeks.index.min()]
+        if history.empty:
+            save_monitor(create_monitor(new_weeks, model))
+            return True
+        state = create_monitor(history, model)
+    state = update_monitor(state, new_weeks, model)
+    save_monitor(state)
+    return needs_retrain(state)
+
+
+def pending_data()->pd.DataFrame:
+    """
+    Obtiene las semanas almacenadas que aún no se han usado para entrenar el modelo.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        DataFrame semanal con las semanas posteriores al último entrenamiento registrado en el monitor.
+    """
+    data_week = charge_weeks()
+    state = charge_monitor()
+    if state is None:
+        return data_week
+    return data_week[data_week.index > pd.Timestamp(state['ultimo_entrenamiento'])]
+
+
+def reset_monitor():
+    """
+    Reinicia el monitor después de un reentrenamiento, usando todas las semanas almacenadas como nueva
+    ventana de referencia y los residuales fuera de muestra registrados por el monitor anterior.
+    """
+    previous = charge_monitor() or {}
+    state = create_monitor(charge_weeks(), load_model(True), previous.get('historial_residuales'))
+    save_monitor(state)
+
+
+def monitor_report()->str:
+    """
+    Construye un reporte en texto con el estado actual del drift y del error.
+
+    Retorna:
+    --------
+    str
+        El reporte con el PSI y KS de cada variable, la razón de error y la decisión de reentrenamiento.
+    """
+    state = charge_monitor()
+    if state is None:
+        return 'El monitor aún no tiene información, se crea con el próximo entrenamiento.'
+    report = drift_report(state)
+    lines = [
+        f"Última semana monitoreada: {state['ultima_semana']}",
+        f"Último entrenamiento: {state['ultimo_entrenamiento']}",
+        report.to_string(),
+        f"Razón de error (MAE reciente / MAE fuera de muestra de referencia): {error_ratio(state):.3f}",
+        f"Umbrales: PSI > {config.MONITOR_PSI}, KS > {config.MONITOR_KS}, razón de error > {config.MONITOR_ERROR_RATIO}",
+        f"¿Requiere reentrenamiento?: {'Sí' if needs_retrain(state) else 'No'}",
+    ]
+    return '\n'.join(lines)
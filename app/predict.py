@@ -1,22 +1,214 @@
+import hashlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
-from train import load_model
+import xgboost as xgb
+
+from app import config
+from app.train import load_model
+from app.transformer import FeatureTransformer, load_transformer
 
 
-def predict(data:pd.DataFrame):
+def predict(data):
     """
     Realiza predicciones sobre un conjunto de datos de entrada utilizando un modelo previamente guardado.
 
+    El transformador guardado junto al modelo lleva los datos a una matriz contigua en float32 con el orden exacto
+    de características, que se evalúa directamente sobre el booster. Un registro, una lista de registros o un array
+    se convierten sin pasar por pandas; un DataFrame (como el que se lee de database/data_week.xlsx) se convierte
+    primero a registros.
+
     Parámetros:
     -----------
-    data : pd.DataFrame
-        DataFrame con los datos de entrada en el formato esperado por el modelo, donde cada fila representa
-        un conjunto de características a ser evaluadas.
+    data : dict, list, np.ndarray o pd.DataFrame
+        Un registro semanal {característica: valor}, una lista de registros, un array en el orden de las
+        características del modelo, o un DataFrame donde cada fila es una semana.
 
     Retorna:
     --------
     np.ndarray
-        Un array con las predicciones generadas por el modelo para cada fila del DataFrame de entrada.
+        Un array con las predicciones generadas por el modelo para cada registro de entrada.
+
+    Lanza:
+    ------
+    SchemaError
+        Si los datos no cumplen el esquema del transformador o tienen valores faltantes o no finitos.
+    """
+    model = load_model(True)
+    rows = load_transformer().to_matrix(data)
+    pred = model.get_booster().inplace_predict(rows)
+    return pred
+
+
+def model_hash()->str:
+    """
+    Calcula el hash SHA-256 del archivo del modelo actual.
+
+    Retorna:
+    --------
+    str
+        El hash hexadecimal del archivo JSON del modelo, usado para identificar las explicaciones
+        generadas con esa versión del modelo.
+    """
+    model_name = 'predictor_xgboost.json'
+    with open(f'{config.MODEL_ROOT_PATH}/{model_name}', 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def charge_explanations()->dict:
+    """
+    Carga la caché de explicaciones almacenada en la ruta especificada en la configuración.
+
+    Retorna:
+    --------
+    dict
+        Un diccionario con la forma {'modelo': hash_modelo, 'semanas': {semana: explicación}}. Si el archivo
+        no existe, se retorna una caché vacía.
+    """
+    path = f'{config.DATABASE_ROOT_PATH}/{config.EXPLANATIONS_NAME}'
+    if not os.path.exists(path):
+        return {'modelo': None, 'semanas': {}}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_explanations(explanations: dict):
+    """
+    Guarda la caché de explicaciones en un archivo JSON en la ruta especificada en la configuración.
+
+    Parámetros:
+    -----------
+    explanations : dict
+        Diccionario con la forma {'modelo': hash_modelo, 'semanas': {semana: explicación}} que se desea almacenar.
+    """
+    path = f'{config.DATABASE_ROOT_PATH}/{config.EXPLANATIONS_NAME}'
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(explanations, file, ensure_ascii=False)
+
+
+def row_hash(row: np.ndarray)->str:
+    """
+    Calcula el hash SHA-256 de una fila de características ya transformada.
+
+    Retorna:
+    --------
+    str
+        El hash hexadecimal de los bytes de la fila, que cambia si cambia cualquier característica de la semana.
+    """
+    return hashlib.sha256(np.ascontiguousarray(row, dtype=np.float32).tobytes()).hexdigest()
+
+
+def compute_contributions(booster: xgb.Booster, transformer: FeatureTransformer, data: pd.DataFrame,
+                          interactions: bool = False)->tuple:
+    """
+    Calcula la predicción y las contribuciones TreeSHAP de cada característica con el cálculo nativo del booster.
+
+    Las contribuciones se obtienen en una sola llamada vectorizada sobre un `DMatrix` con `pred_contribs`
+    (o `pred_interactions` si se piden interacciones). Como las contribuciones de cada fila suman el margen
+    del modelo, la predicción se obtiene de esa misma llamada sin volver a evaluar los árboles.
+
+    Parámetros:
+    -----------
+    booster : xgb.Booster
+        El booster del modelo cargado.
+
+    transformer : FeatureTransformer
+        El transformador guardado junto al modelo, usado para construir la matriz de características.
+
+    data : pd.DataFrame
+        DataFrame con una fila por semana y las características esperadas por el modelo.
+
+    interactions : bool, opcional
+        Si es True, se calculan también las interacciones entre pares de características.
+
+    Retorna:
+    --------
+    tuple
+        Una tupla (predicciones, contribuciones, interacciones) con arreglos de forma (n,), (n, f + 1) y
+        (n, f + 1, f + 1) respectivamente. La última columna corresponde al sesgo del modelo. Si no se piden
+        interacciones, el tercer elemento es None.
+    """
+    rows = transformer.to_matrix(data)
+    dmatrix = xgb.DMatrix(rows, feature_names=transformer.features)
+    if interactions:
+        interaction_values = booster.predict(dmatrix, pred_interactions=True)
+        contributions = interaction_values.sum(axis=2)
+    else:
+        interaction_values = None
+        contributions = booster.predict(dmatrix, pred_contribs=True)
+    predictions = contributions.sum(axis=1, dtype=np.float64)
+    return predictions, contributions, interaction_values
+
+
+def explain(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Explica las predicciones semanales indicando cuánto aporta cada característica al valor predicho.
+
+    Las explicaciones de cada semana se almacenan en caché junto al hash de su fila de características, y la
+    caché completa se asocia al hash del modelo. Una semana se vuelve a calcular si no está en caché o si sus
+    características cambiaron (por ejemplo después de --rebuild), y la caché se descarta completa cuando el
+    modelo cambia. Las semanas pendientes se calculan todas juntas en una sola llamada a `compute_contributions`.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        DataFrame con los datos de entrada indexado por la fecha de la semana, en el formato esperado por el modelo.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame indexado por semana con la columna 'Predicción', la contribución de cada característica
+        y la columna 'Sesgo' con el valor base del modelo.
+    """
+    model = load_model(True)
+    booster = model.get_booster()
+    transformer = load_transformer()
+    columns = booster.feature_names + ['Sesgo']
+    current_hash = model_hash()
+    explanations = charge_explanations()
+    if explanations.get('modelo') != current_hash:
+        explanations = {'modelo': current_hash, 'semanas': {}}
+    cached = explanations['semanas']
+    weeks = [str(pd.Timestamp(week).date()) for week in data.index]
+    hashes = [row_hash(row) for row in transformer.to_matrix(data)]
+    missing = [i for i, week in enumerate(weeks) if week not in cached or cached[week]['huella'] != hashes[i]]
+    if missing:
+        predictions, contributions, _ = compute_contributions(booster, transformer, data.iloc[missing])
+        for row, i in enumerate(missing):
+            cached[weeks[i]] = {
+                'huella': hashes[i],
+                'prediccion': float(predictions[row]),
+                'contribuciones': dict(zip(columns, contributions[row].tolist())),
+            }
+        save_explanations(explanations)
+    result = pd.DataFrame([cached[week]['contribuciones'] for week in weeks], index=data.index, columns=columns)
+    result.insert(0, 'Predicción', [cached[week]['prediccion'] for week in weeks])
+    return result
+
+
+def explain_interactions(data: pd.DataFrame)->dict:
+    """
+    Calcula las interacciones TreeSHAP entre pares de características de cada semana.
+
+    Las interacciones ocupan (f + 1)² valores por semana, por lo que no se guardan en la caché de
+    explicaciones y se calculan solo cuando se piden.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        DataFrame con los datos de entrada indexado por la fecha de la semana, en el formato esperado por el modelo.
+
+    Retorna:
+    --------
+    dict
+        Diccionario {semana: DataFrame} con la matriz de interacciones de cada semana, indexada por
+        característica en filas y columnas e incluyendo el sesgo.
     """
     model = load_model(True)
-    pred = model.predict(data)
-    return pred
\ No newline at end of file
+    booster = model.get_booster()
+    columns = booster.feature_names + ['Sesgo']
+    _, _, interaction_values = compute_contributions(booster, load_transformer(), data, True)
+    return {week: pd.DataFrame(values, index=columns, columns=columns)
+            for week, values in zip(data.index, interaction_values)}
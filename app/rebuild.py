@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from app import config
+from app.data_processing import (build_week_features, charge_data, check_memory, finish_week_features,
+                                 group_chunk_by_week, pre_process_new_data, reduce_dimentionality,
+                                 save_data_week, split_by_week)
+
+
+def process_chunk(data: pd.DataFrame)->pd.DataFrame:
+    """
+    Pre-procesa un bloque de semanas completas de facturación y lo agrupa por semana.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        Bloque de registros de facturación en bruto indexado por 'Creado el'.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        El bloque agrupado por semana con `group_chunk_by_week`.
+    """
+    data = pre_process_new_data(data)
+    data = reduce_dimentionality(data)
+    return group_chunk_by_week(data)
+
+
+def build_history(workers: int = None)->pd.DataFrame:
+    """
+    Construye las características semanales de toda la historia de facturación en una sola pasada.
+
+    Los registros se dividen en bloques de semanas completas, uno por proceso, que se pre-procesan y agrupan
+    en paralelo; luego las ventanas móviles y el resto de características se calculan una sola vez sobre la
+    historia completa. Como cada paso por registro es independiente y ninguna semana queda repartida entre
+    bloques, el resultado es el mismo que se obtiene al procesar la historia de forma incremental semana a semana.
+    Si hay un presupuesto de memoria, la historia se procesa en un solo proceso con `build_week_features`.
+
+    Parámetros:
+    -----------
+    workers : int, opcional
+        El número de procesos. Por defecto, el número de núcleos.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        Un DataFrame indexado por semana con 'Valor neto' y las características en el orden del modelo.
+    """
+    data = charge_data()
+    data = data.sort_values(by="Creado el", ascending=True)
+    data = data.set_index("Creado el")
+    if config.MEMORY_BUDGET is not None:
+        data = pre_process_new_data(data)
+        check_memory('Pre-procesado', data)
+        return build_week_features(data)
+    workers = workers or os.cpu_count()
+    chunks = list(split_by_week(data, -(-len(data) // workers)))
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        weeks = list(executor.map(process_chunk, chunks))
+    return finish_week_features(weeks)
+
+
+def rebuild(workers: int = None)->pd.DataFrame:
+    """
+    Regenera el archivo de datos semanales a partir de toda la historia de facturación.
+
+    Parámetros:
+    -----------
+    workers : int, opcional
+        El número de procesos. Por defecto, el número de núcleos.
+
+    Retorna:
+    --------
+    pd.DataFrame
+        El DataFrame semanal que se guardó.
+    """
+    data_week = build_history(workers)
+    save_data_week(data_week)
+    return data_week
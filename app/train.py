@@ -1,13 +1,17 @@
 import pandas as pd
 import xgboost as xgb
 
-import config
+from app import config
+from app.transformer import FeatureTransformer, load_transformer, save_transformer
 
 
 def load_model(predict = False) -> xgb.XGBRegressor:
     """
     Carga un modelo previamente entrenado de XGBoost y, opcionalmente, guarda una copia del modelo cargado.
 
+    Al cargar el modelo se verifica que sus características coincidan con las del transformador guardado
+    junto a él, de modo que un cambio de esquema se detecte antes de realizar una predicción.
+
     Parámetros:
     -----------
     predict : bool, opcional
@@ -18,12 +22,21 @@ def load_model(predict = False) -> xgb.XGBRegressor:
     --------
     xgb.XGBRegressor
         El modelo cargado de XGBoost que se puede utilizar para realizar predicciones o continuar con el entrenamiento.
+
+    Lanza:
+    ------
+    SchemaError
+        Si las características del modelo no coinciden con las del transformador.
     """
     model_name = 'predictor_xgboost.json'
     model = xgb.XGBRegressor()  # Crear un nuevo objeto XGBRegressor
     model.load_model(f'{config.MODEL_ROOT_PATH}/predictor_xgboost.json')
+    transformer = load_transformer()
+    booster = model.get_booster()
+    transformer.validate(booster.feature_names, booster.feature_types)
     if not predict:
         model.save_model(f'{config.MODEL_ROOT_PATH}/last_model/{model_name}')
+        save_transformer(transformer, f'{config.MODEL_ROOT_PATH}/last_model')
     return model
 
 
@@ -39,31 +52,73 @@ def re_train_model(model: xgb.XGBRegressor, data:pd.DataFrame)->xgb.XGBRegressor
 
     data : pd.DataFrame
         El conjunto de datos con los cuales se reentrenará el modelo. Este DataFrame debe contener una columna 
-        llamada 'Valor neto', que se utilizará como la variable objetivo (Y). El resto de las columnas se utilizarán 
-        como las variables independientes (X).
+        llamada 'Valor neto', que se utilizará como la variable objetivo (Y). Las características se ordenan y 
+        completan según el transformador guardado y se utilizarán como las variables independientes (X).
 
     Retorna:
     --------
     xgb.XGBRegressor
         El modelo de XGBoost reentrenado con los nuevos datos.
     """
+    data = load_transformer().align(data)
     Y=data['Valor neto']
     X=data.drop(columns=['Valor neto'])
     model.fit(X, Y, xgb_model=model.get_booster()) 
     return model
 
 
-def save_new_model(model: xgb.XGBRegressor):
+def fit_new_model(data: pd.DataFrame, n_jobs: int = None)->xgb.XGBRegressor:
     """
-    Guarda un modelo de XGBoost en un archivo JSON en la ruta especificada en la configuración.
+    Entrena desde cero un modelo de XGBoost con los hiperparámetros de `config.MODEL_PARAMS`, que son los
+    elegidos con la búsqueda de hiperparámetros del notebook de análisis.
+
+    Parámetros:
+    -----------
+    data : pd.DataFrame
+        El conjunto de datos semanal con la columna 'Valor neto' y las características, que se ordenan y
+        completan según un transformador ajustado con las categorías de la configuración.
+
+    n_jobs : int, opcional
+        El número de hilos de XGBoost. Por defecto, todos los disponibles.
+
+    Retorna:
+    --------
+    xgb.XGBRegressor
+        El modelo de XGBoost entrenado.
+    """
+    data = FeatureTransformer.fit().align(data)
+    model = xgb.XGBRegressor(**config.MODEL_PARAMS, n_jobs=n_jobs)
+    model.fit(data.drop(columns=['Valor neto']), data['Valor neto'])
+    return model
+
+
+def save_new_model(model: xgb.XGBRegressor, root: str = None):
+    """
+    Guarda un modelo de XGBoost en un archivo JSON junto al transformador de características ajustado para él.
+
+    El transformador se ajusta con las categorías de la configuración y se valida contra el booster antes de
+    guardar, de modo que nunca quede un modelo guardado con un transformador que no le corresponde.
 
     Parámetros:
     -----------
     model : xgb.XGBRegressor
         El modelo de XGBoost que se desea guardar. Este modelo debe haber sido entrenado previamente.
+
+    root : str, opcional
+        La carpeta donde se guardan el modelo y el transformador. Por defecto, la carpeta del modelo.
+
+    Lanza:
+    ------
+    SchemaError
+        Si las características del modelo no coinciden con las del transformador ajustado.
     """
     model_name = 'predictor_xgboost.json'
-    model.save_model(f'{config.MODEL_ROOT_PATH}/{model_name}')
+    root = root or config.MODEL_ROOT_PATH
+    transformer = FeatureTransformer.fit()
+    booster = model.get_booster()
+    transformer.validate(booster.feature_names, booster.feature_types)
+    model.save_model(f'{root}/{model_name}')
+    save_transformer(transformer, root)
 
 
 def train_model(data: pd.DataFrame):
@@ -0,0 +1,300 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from app import config
+
+
+class SchemaError(Exception):
+    def __init__(self, message="Error in feature schema"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class FeatureTransformer:
+    """
+    Transformador ajustado que congela el esquema de características del modelo.
+
+    Guarda los vocabularios de cada variable categórica, el orden exacto de las características y su tipo,
+    y convierte un registro semanal en una fila contigua de NumPy en float32 usando un mapa de índices
+    precalculado, sin pasar por pandas.
+
+    Atributos:
+    ----------
+    vocabularies : dict
+        Diccionario {prefijo: [categorías]} con las categorías de cada variable codificada con one-hot.
+
+    features : list
+        Lista con el nombre de cada característica en el orden que espera el modelo.
+
+    dtypes : dict
+        Diccionario {característica: tipo} con el tipo de cada característica ('int' o 'float').
+    """
+
+    def __init__(self, vocabularies: dict, features: list, dtypes: dict):
+        self.vocabularies = vocabularies
+        self.features = features
+        self.dtypes = dtypes
+        self.index = {name: position for position, name in enumerate(features)}
+        self.prefixes = tuple(f'{prefix}_' for prefix in vocabularies)
+        encoded = {f'{prefix}_{category}' for prefix, categories in vocabularies.items() for category in categories}
+        self.required = [name for name in features if name not in encoded]
+
+    def unknown(self, names) -> list:
+        """
+        Obtiene las columnas one-hot que no pertenecen a los vocabularios del transformador.
+
+        Parámetros:
+        -----------
+        names : iterable
+            Los nombres de las columnas o claves de un registro.
+
+        Retorna:
+        --------
+        list
+            Lista con las columnas que empiezan por un prefijo codificado pero no son características del modelo,
+            por ejemplo 'Freq_centro_530999' para un centro que no existía al ajustar el transformador.
+        """
+        return [name for name in names if name not in self.index and str(name).startswith(self.prefixes)]
+
+    @classmethod
+    def fit(cls) -> 'FeatureTransformer':
+        """
+        Ajusta el transformador a partir de las categorías definidas en la configuración.
+
+        Retorna:
+        --------
+        FeatureTransformer
+            Un transformador con los vocabularios, el orden y los tipos de las características del modelo.
+        """
+        vocabularies = {
+            'Freq_Poblacion': ['Otro'] + config.POBLACION,
+            'Freq_Aseguradora': ['Otro'] + config.ASEGURADORA,
+            'Freq_Genero': [name.split('_', 1)[1] for name in config.GENERO],
+            'Freq_centro': [name.split('_', 1)[1] for name in config.CENTRO_RESPONSABILIDAD],
+            'Freq_Episodio': [name.split('_', 1)[1] for name in config.CLASE_EPISODIO],
+            'Mes': [str(month) for month in range(1, 13)],
+        }
+        features = ['Edad']
+        dtypes = {'Edad': 'int'}
+        for prefix, categories in vocabularies.items():
+            for category in categories:
+                features.append(f'{prefix}_{category}')
+                dtypes[f'{prefix}_{category}'] = 'int' if prefix == 'Mes' else 'float'
+        features.append('Semana')
+        dtypes['Semana'] = 'int'
+        return cls(vocabularies, features, dtypes)
+
+    def validate(self, feature_names: list, feature_types: list):
+        """
+        Verifica que el esquema del transformador coincida con el del modelo.
+
+        Parámetros:
+        -----------
+        feature_names : list
+            Nombres de las características del booster, en su orden.
+
+        feature_types : list
+            Tipos de las características del booster, en su orden.
+
+        Lanza:
+        ------
+        SchemaError
+            Si los nombres, el orden o los tipos no coinciden.
+        """
+        if list(feature_names) != self.features:
+            missing = [name for name in feature_names if name not in self.index]
+            extra = [name for name in self.features if name not in set(feature_names)]
+            message = f'Las características del modelo no coinciden con el transformador. Faltan: {missing}. Sobran: {extra}'
+            raise SchemaError(message)
+        if feature_types is not None and list(feature_types) != [self.dtypes[name] for name in self.features]:
+            raise SchemaError('Los tipos de las características del modelo no coinciden con el transformador')
+
+    def transform(self, record: dict) -> np.ndarray:
+        """
+        Convierte un registro semanal en una fila de características.
+
+        Parámetros:
+        -----------
+        record : dict
+            Diccionario {característica: valor} con el registro semanal alineado, con todas las características.
+            Las claves que no son características ni columnas one-hot (como 'Valor neto') se ignoran.
+
+        Retorna:
+        --------
+        np.ndarray
+            Un array contiguo en float32 de forma (n_características,).
+        """
+        return self.transform_many([record])[0]
+
+    def transform_many(self, records: list) -> np.ndarray:
+        """
+        Convierte una lista de registros semanales en una matriz de características.
+
+        Parámetros:
+        -----------
+        records : list
+            Lista de diccionarios {característica: valor}.
+
+        Retorna:
+        --------
+        np.ndarray
+            Un array contiguo en float32 de forma (n_registros, n_características).
+
+        Lanza:
+        ------
+        SchemaError
+            Si a algún registro le falta alguna característica, trae columnas one-hot que no están en los
+            vocabularios o tiene valores faltantes o no finitos (XGBoost los tomaría como valores ausentes), ya que
+            en todos estos casos la predicción sería incorrecta sin ningún aviso.
+        """
+        rows = np.zeros((len(records), len(self.features)), dtype=np.float32)
+        for row, record in zip(rows, records):
+            missing = [name for name in self.features if name not in record]
+            if missing:
+                raise SchemaError(f'Al registro le faltan las características {missing}')
+            unknown = self.unknown(record)
+            if unknown:
+                raise SchemaError(f'El registro tiene columnas que no están en los vocabularios del modelo: {unknown}')
+            for name, value in record.items():
+                position = self.index.get(name)
+                if position is not None:
+                    row[position] = value
+        return self.check_finite(rows)
+
+    def check_finite(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Verifica que una matriz de características no tenga valores faltantes ni infinitos.
+
+        Parámetros:
+        -----------
+        rows : np.ndarray
+            Matriz de forma (n_registros, n_características) en el orden del transformador.
+
+        Retorna:
+        --------
+        np.ndarray
+            La misma matriz, si todos sus valores son finitos.
+
+        Lanza:
+        ------
+        SchemaError
+            Si algún valor es NaN o infinito, indicando las características afectadas.
+        """
+        invalid = ~np.isfinite(rows)
+        if invalid.any():
+            names = [self.features[position] for position in np.flatnonzero(invalid.any(axis=0))]
+            raise SchemaError(f'Hay valores faltantes o no finitos en las características {names}')
+        return rows
+
+    def to_matrix(self, data) -> np.ndarray:
+        """
+        Convierte los datos de entrada de una predicción en la matriz de características del modelo.
+
+        Un registro o una lista de registros se convierten con `transform_many` sin pasar por pandas, y un array
+        que ya está en el orden del transformador solo se valida. Un DataFrame se convierte a registros, por lo que
+        es el camino más lento y se mantiene para los datos semanales que se leen de Excel.
+
+        Parámetros:
+        -----------
+        data : dict, list, np.ndarray o pd.DataFrame
+            Un registro {característica: valor}, una lista de registros, un array de forma (n_características,)
+            o (n_registros, n_características) en el orden de `features`, o un DataFrame semanal.
+
+        Retorna:
+        --------
+        np.ndarray
+            Un array contiguo en float32 de forma (n_registros, n_características).
+
+        Lanza:
+        ------
+        SchemaError
+            Si los registros no cumplen el esquema, si el array no tiene una columna por característica o si hay
+            valores no finitos.
+        """
+        if isinstance(data, dict):
+            return self.transform_many([data])
+        if isinstance(data, pd.DataFrame):
+            return self.transform_many(data.to_dict('records'))
+        if isinstance(data, np.ndarray):
+            rows = np.ascontiguousarray(np.atleast_2d(data), dtype=np.float32)
+            if rows.ndim != 2 or rows.shape[1] != len(self.features):
+                raise SchemaError(f'Se esperaba un array con {len(self.features)} características y se recibió '
+                                  f'uno de forma {data.shape}')
+            return self.check_finite(rows)
+        return self.transform_many(list(data))
+
+    def align(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Ordena y completa las columnas de un DataFrame semanal según el esquema del transformador.
+
+        Las columnas one-hot ausentes se completan con cero, porque la categoría no apareció en esas semanas, las
+        columnas que no son características se eliminan (excepto 'Valor neto') y cada columna se convierte al tipo
+        congelado, como int32 o float32. Las columnas one-hot de categorías que no están en los vocabularios no se
+        descartan en silencio: se lanza un SchemaError para agregarlas a la configuración y entrenar un modelo nuevo.
+        También se lanza un SchemaError si alguna característica tiene valores faltantes o infinitos.
+
+        Parámetros:
+        -----------
+        data : pd.DataFrame
+            DataFrame semanal con las características calculadas.
+
+        Retorna:
+        --------
+        pd.DataFrame
+            DataFrame con 'Valor neto' (si existe) seguido de las características en el orden del modelo.
+        """
+        missing = [name for name in self.required if name not in data.columns]
+        if missing:
+            raise SchemaError(f'A los datos les faltan las características {missing}')
+        unknown = self.unknown(data.columns)
+        if unknown:
+            raise SchemaError(f'Los datos tienen columnas que no están en los vocabularios del modelo: {unknown}')
+        columns = (['Valor neto'] if 'Valor neto' in data.columns else []) + self.features
+        data = data.reindex(columns=columns, fill_value=0)
+        self.check_finite(data[self.features].to_numpy(dtype=np.float64))
+        return data.astype({name: np.int32 if self.dtypes[name] == 'int' else np.float32 for name in self.features})
+
+    def to_dict(self) -> dict:
+        return {'vocabularies': self.vocabularies, 'features': self.features, 'dtypes': self.dtypes}
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'FeatureTransformer':
+        return cls(values['vocabularies'], values['features'], values['dtypes'])
+
+
+def load_transformer(root: str = None) -> FeatureTransformer:
+    """
+    Carga el transformador guardado junto al modelo.
+
+    Parámetros:
+    -----------
+    root : str, opcional
+        La carpeta donde se encuentra el transformador. Por defecto, la carpeta del modelo.
+
+    Retorna:
+    --------
+    FeatureTransformer
+        El transformador cargado.
+    """
+    root = root or config.MODEL_ROOT_PATH
+    with open(f'{root}/{config.TRANSFORMER_NAME}', encoding='utf-8') as file:
+        return FeatureTransformer.from_dict(json.load(file))
+
+
+def save_transformer(transformer: FeatureTransformer, root: str = None):
+    """
+    Guarda el transformador en un archivo JSON junto al modelo.
+
+    Parámetros:
+    -----------
+    transformer : FeatureTransformer
+        El transformador que se desea guardar.
+
+    root : str, opcional
+        La carpeta donde se guarda el transformador. Por defecto, la carpeta del modelo.
+    """
+    root = root or config.MODEL_ROOT_PATH
+    with open(f'{root}/{config.TRANSFORMER_NAME}', 'w', encoding='utf-8') as file:
+        json.dump(transformer.to_dict(), file, ensure_ascii=False, indent=1)
@@ -0,0 +1,69 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+
+
+MODEL_ROOT = Path(config.MODEL_ROOT_PATH)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Apunta la base de datos y la carpeta del modelo de la configuración a carpetas temporales.
+
+    La carpeta del modelo recibe una copia del transformador incluido en el repositorio.
+    """
+    database_root = tmp_path / 'database'
+    model_root = tmp_path / 'model'
+    database_root.mkdir()
+    model_root.mkdir()
+    shutil.copy(MODEL_ROOT / config.TRANSFORMER_NAME, model_root / config.TRANSFORMER_NAME)
+    monkeypatch.setattr(config, 'DATABASE_ROOT_PATH', str(database_root))
+    monkeypatch.setattr(config, 'MODEL_ROOT_PATH', str(model_root))
+    monkeypatch.setattr(config, 'MEMORY_BUDGET', None)
+    return database_root
+
+
+def billing_records(weeks: int, rows_per_week: int = 150, seed: int = 0)->pd.DataFrame:
+    """
+    Genera registros de facturación sintéticos con el formato de Facturacion.xlsx para `weeks` semanas completas,
+    de lunes a domingo, desde el lunes 2 de enero de 2023.
+    """
+    rng = np.random.default_rng(seed)
+    n = weeks * rows_per_week
+    start = pd.Timestamp('2023-01-02')
+    seconds = np.sort(rng.integers(0, weeks * 7 * 24 * 3600, n))
+    insurers = ['EPS SURA', 'Salud Total S.A.', 'PARTICULARES', 'Coomeva Medicina Prepagada', 'Otra aseguradora 12']
+    cities = ['Medellín', 'Rionegro', 'La Ceja', 'Bogotá D.C.', None]
+    return pd.DataFrame({
+        'Creado el': start + pd.to_timedelta(seconds, unit='s'),
+        'Edad': rng.choice(['34', '70', '12 D', '5 A', '81'], n),
+        'Aseguradora': rng.choice(insurers, n),
+        'Población': rng.choice(np.array(cities, dtype=object), n),
+        'Género': rng.choice(['F', 'M'], n),
+        'Clase episodio': rng.choice(['Ambulatorio', 'Hospitalizado'], n),
+        'Centro de Responsabilidad': rng.choice([530101, 530718, 530815], n),
+        'Mon.': rng.choice(['COP', 'USD'], n, p=[0.95, 0.05]),
+        'Valor neto': rng.integers(10_000, 5_000_000, n),
+        'Causa Externa': rng.choice(['Enfermedad general', None], n),
+        'Pais de Nacimiento': rng.choice(['Colombia', 'Venezuela'], n),
+        'Código Episodio': rng.integers(100_000, 999_999, n),
+    })
+
+
+@pytest.fixture
+def billing(database):
+    """
+    Escribe en la base de datos temporal 26 semanas de facturación sintética y la TRM diaria que las cubre.
+    """
+    data = billing_records(26)
+    data.to_excel(database / config.CSV_NAME, index=False)
+    dates = pd.date_range('2022-12-26', '2023-07-31', freq='D')
+    pd.DataFrame({'Fecha': dates.strftime('%Y-%m-%d'), 'TRM': np.linspace(4700, 4000, len(dates)).round(2)}) \
+        .to_csv(database / config.TRM_NAME, index=False)
+    return data
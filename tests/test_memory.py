@@ -0,0 +1,61 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from app import config, data_processing
+from app.data_processing import MemoryBudgetError, compact_types, frame_size, read_excel, reduce_dimentionality
+from app.rebuild import build_history
+from conftest import billing_records
+
+
+@pytest.fixture(scope='module')
+def large_workbook(tmp_path_factory):
+    path = tmp_path_factory.mktemp('billing') / config.CSV_NAME
+    billing_records(26, rows_per_week=600).to_excel(path, index=False)
+    return path
+
+
+@pytest.fixture
+def large_billing(billing, database, large_workbook):
+    shutil.copy(large_workbook, database / config.CSV_NAME)
+    return database
+
+
+def test_missing_population_and_insurer_become_otro_with_compact_types():
+    raw = pd.DataFrame({'Población': ['medellin', 'Otro', None, 'bogota'],
+                        'Aseguradora': ['sura', None, None, 'otra']})
+    reduced = reduce_dimentionality(compact_types(raw))
+    assert reduced.astype(object).values.tolist() == [['medellin', 'sura'], ['Otro', 'Otro'],
+                                                      ['Otro', 'Otro'], ['Otro', 'Otro']]
+
+
+def test_streamed_load_equals_pandas_load(large_billing, monkeypatch):
+    path = f'{config.DATABASE_ROOT_PATH}/{config.CSV_NAME}'
+    expected = read_excel(path)
+    monkeypatch.setattr(config, 'MEMORY_BUDGET', 3 * frame_size(expected))
+    streamed = read_excel(path)
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_load_needs_the_data_once_not_twice(large_billing, monkeypatch):
+    path = f'{config.DATABASE_ROOT_PATH}/{config.CSV_NAME}'
+    size = frame_size(read_excel(path))
+    monkeypatch.setattr(config, 'MEMORY_BUDGET', 1.8 * size)
+    assert len(read_excel(path)) == 26 * 600
+    monkeypatch.setattr(config, 'MEMORY_BUDGET', 0.9 * size)
+    with pytest.raises(MemoryBudgetError):
+        read_excel(path)
+
+
+def test_budget_that_fits_the_load_but_not_the_one_hot_is_processed_by_chunks(large_billing, monkeypatch, capsys):
+    expected = build_history(1)
+    size = frame_size(read_excel(f'{config.DATABASE_ROOT_PATH}/{config.CSV_NAME}'))
+    chunks = []
+    week_chunks = data_processing.week_chunks
+    monkeypatch.setattr(data_processing, 'week_chunks', lambda data: chunks.extend(week_chunks(data)) or chunks)
+    monkeypatch.setattr(config, 'MEMORY_BUDGET', 2 * size)
+    chunked = build_history()
+    assert 'se procesa por bloques' in capsys.readouterr().out
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(chunked, expected)
@@ -0,0 +1,92 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+from app import config, main
+from app.data_processing import TrainError
+from app.monitor import create_monitor, drift_report, histogram, needs_retrain, quantile_edges, update_monitor
+from app.transformer import load_transformer
+
+
+def weekly_data(weeks: int, start: str = '2023-01-01', seed: int = 0)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    features = load_transformer().features
+    index = pd.date_range(start, periods=weeks, freq='W')
+    data = pd.DataFrame(rng.integers(5, 15, size=(weeks, len(features))), index=index, columns=features)
+    data[[name for name in features if name.startswith('Freq_Aseguradora_sura')]] = 0
+    data['Valor neto'] = data['Edad'] * 1000.0 + rng.normal(0, 100, size=weeks)
+    return data
+
+
+@pytest.fixture
+def model(database):
+    history = weekly_data(60)
+    model = xgb.XGBRegressor(n_estimators=20, max_depth=2)
+    model.fit(history[load_transformer().features], history['Valor neto'])
+    return model
+
+
+def test_value_outside_constant_reference_falls_in_its_own_bin():
+    edges = quantile_edges(np.zeros(50))
+    assert histogram(np.zeros(50), edges).tolist() == [0, 50, 0]
+    assert histogram(np.array([500.0, -1.0]), edges).tolist() == [1, 0, 1]
+
+
+def test_values_beyond_reference_range_fall_in_open_bins():
+    edges = quantile_edges(np.arange(100.0))
+    counts = histogram(np.array([-5.0, 0.0, 99.0, 150.0]), edges)
+    assert len(counts) == len(edges) + 2
+    assert counts[0] == 1 and counts[1] == 1 and counts[-1] == 1 and counts[-2] == 1
+
+
+def test_new_category_in_a_feature_that_was_always_zero_is_drift(model):
+    history = weekly_data(60)
+    state = create_monitor(history, model, residuals=[100.0] * config.MONITOR_RESIDUAL_WEEKS)
+    new_weeks = weekly_data(10, start='2024-03-01', seed=1)
+    new_weeks['Freq_Aseguradora_sura'] = 500
+    state = update_monitor(state, new_weeks, model)
+    report = drift_report(state)
+    assert report.loc['Freq_Aseguradora_sura', 'PSI'] > config.MONITOR_PSI
+    assert report.loc['Freq_Aseguradora_sura', 'KS'] > config.MONITOR_KS
+    assert needs_retrain(state)
+
+
+def test_shifted_feature_is_drift_and_stationary_feature_is_not(model):
+    history = weekly_data(60)
+    state = create_monitor(history, model, residuals=[100.0] * config.MONITOR_RESIDUAL_WEEKS)
+    new_weeks = weekly_data(20, start='2024-03-01', seed=2)
+    new_weeks['Freq_Genero_F'] += 20
+    report = drift_report(update_monitor(state, new_weeks, model))
+    assert report.loc['Freq_Genero_F', 'PSI'] > config.MONITOR_PSI
+    assert report.loc['Freq_Genero_F', 'KS'] > config.MONITOR_KS
+    assert report.loc['Freq_Genero_M', 'PSI'] < config.MONITOR_PSI
+    assert report.loc['Freq_Genero_M', 'KS'] < config.MONITOR_KS
+
+
+def test_forzar_retrains_pending_weeks_without_new_billing(monkeypatch):
+    pending = weekly_data(3)
+    calls = []
+
+    def no_new_billing(train_model=False):
+        raise TrainError('El modelo está actualizado con la última información')
+
+    monkeypatch.setattr(main, 'load_data', no_new_billing)
+    monkeypatch.setattr(main, 'pending_data', lambda: pending)
+    monkeypatch.setattr(main, 'train_model', lambda data: calls.append(('train', len(data))))
+    monkeypatch.setattr(main, 'reset_monitor', lambda: calls.append(('reset',)))
+    monkeypatch.setattr(sys, 'argv', ['app.main', '--entrenar', '--forzar'])
+    main.main()
+    assert calls == [('train', 3), ('reset',)]
+
+
+def test_without_forzar_no_new_billing_still_raises(monkeypatch):
+    def no_new_billing(train_model=False):
+        raise TrainError('El modelo está actualizado con la última información')
+
+    monkeypatch.setattr(main, 'load_data', no_new_billing)
+    monkeypatch.setattr(sys, 'argv', ['app.main', '--entrenar'])
+    with pytest.raises(TrainError):
+        main.main()
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from app import config
+from app.data_processing import charge_data, load_data, save_data_week
+from app.rebuild import rebuild
+
+
+def data_week_bytes()->bytes:
+    with open(f'{config.DATABASE_ROOT_PATH}/{config.DATA_WEEK}', 'rb') as file:
+        return file.read()
+
+
+def test_rebuild_is_deterministic(billing):
+    rebuild(1)
+    first = data_week_bytes()
+    rebuild(2)
+    assert data_week_bytes() == first
+
+
+def test_incremental_full_week_ingests_equal_rebuild(billing, database):
+    rebuild(1)
+    expected = data_week_bytes()
+    data_week = charge_data(True).set_index('Creado el')
+    save_data_week(data_week.iloc[:10])
+    for weeks in (14, 20, 26):
+        end = pd.Timestamp('2023-01-02') + pd.Timedelta(weeks=weeks)
+        billing[billing['Creado el'] < end].to_excel(database / config.CSV_NAME, index=False)
+        load_data(True)
+    assert data_week_bytes() == expected
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+from app.predict import predict
+from app.train import save_new_model
+from app.transformer import FeatureTransformer, SchemaError
+
+
+@pytest.fixture
+def transformer():
+    return FeatureTransformer.fit()
+
+
+def weekly_data(transformer, weeks=3):
+    data = pd.DataFrame(np.ones((weeks, len(transformer.features)), dtype=int), columns=transformer.features,
+                        index=pd.date_range('2024-01-07', periods=weeks, freq='W'))
+    data['Valor neto'] = 1000.0
+    return data
+
+
+def test_validate_accepts_its_own_schema(transformer):
+    transformer.validate(transformer.features, [transformer.dtypes[name] for name in transformer.features])
+
+
+def test_validate_rejects_missing_extra_or_reordered_features(transformer):
+    with pytest.raises(SchemaError):
+        transformer.validate(transformer.features[:-1], None)
+    with pytest.raises(SchemaError):
+        transformer.validate(transformer.features + ['Freq_centro_530999'], None)
+    with pytest.raises(SchemaError):
+        transformer.validate(transformer.features[::-1], None)
+
+
+def test_validate_rejects_different_types(transformer):
+    with pytest.raises(SchemaError):
+        transformer.validate(transformer.features, ['float'] * len(transformer.features))
+
+
+def test_align_completes_orders_and_casts(transformer):
+    data = weekly_data(transformer).drop(columns=['Freq_centro_530101', 'Mes_3'])
+    data = data[data.columns[::-1]]
+    aligned = transformer.align(data)
+    assert list(aligned.columns) == ['Valor neto'] + transformer.features
+    assert (aligned['Freq_centro_530101'] == 0).all() and (aligned['Mes_3'] == 0).all()
+    assert aligned['Semana'].dtype == np.int32 and aligned['Freq_Genero_F'].dtype == np.float32
+
+
+def test_align_rejects_missing_required_feature(transformer):
+    with pytest.raises(SchemaError):
+        transformer.align(weekly_data(transformer).drop(columns=['Edad']))
+
+
+def test_align_rejects_unknown_category(transformer):
+    data = weekly_data(transformer)
+    data['Freq_centro_530999'] = 1.0
+    with pytest.raises(SchemaError):
+        transformer.align(data)
+
+
+def test_align_rejects_missing_values(transformer):
+    data = weekly_data(transformer).astype({'Freq_Genero_F': float})
+    data.iloc[1, data.columns.get_loc('Freq_Genero_F')] = np.nan
+    with pytest.raises(SchemaError):
+        transformer.align(data)
+
+
+def test_transform_many_rejects_missing_unknown_and_non_finite(transformer):
+    record = weekly_data(transformer).drop(columns=['Valor neto']).to_dict('records')[0]
+    with pytest.raises(SchemaError):
+        transformer.transform_many([{name: value for name, value in record.items() if name != 'Mes_1'}])
+    with pytest.raises(SchemaError):
+        transformer.transform_many([{**record, 'Freq_Poblacion_bogota': 1}])
+    with pytest.raises(SchemaError):
+        transformer.transform_many([{**record, 'Mes_4': np.nan}])
+    with pytest.raises(SchemaError):
+        transformer.transform_many([{**record, 'Edad': np.inf}])
+
+
+def test_to_matrix_gives_the_same_rows_for_every_input(transformer):
+    data = weekly_data(transformer)
+    data['Edad'] = [30, 40, 50]
+    expected = transformer.transform_many(data.to_dict('records'))
+    assert expected.dtype == np.float32 and expected.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(transformer.to_matrix(data), expected)
+    np.testing.assert_array_equal(transformer.to_matrix(data.to_dict('records')), expected)
+    np.testing.assert_array_equal(transformer.to_matrix(data.to_dict('records')[0]), expected[:1])
+    np.testing.assert_array_equal(transformer.to_matrix(expected.astype(float)), expected)
+
+
+def test_to_matrix_rejects_arrays_with_wrong_shape_or_nan(transformer):
+    with pytest.raises(SchemaError):
+        transformer.to_matrix(np.zeros((2, len(transformer.features) - 1)))
+    rows = np.zeros((2, len(transformer.features)))
+    rows[0, 3] = np.nan
+    with pytest.raises(SchemaError):
+        transformer.to_matrix(rows)
+
+
+def test_predict_accepts_a_record_without_pandas(database, transformer):
+    data = weekly_data(transformer, weeks=20)
+    data['Edad'] = np.arange(20)
+    data['Valor neto'] = data['Edad'] * 100.0
+    aligned = transformer.align(data)
+    model = xgb.XGBRegressor(n_estimators=5, max_depth=2)
+    model.fit(aligned.drop(columns=['Valor neto']), aligned['Valor neto'])
+    save_new_model(model)
+    features = data.drop(columns=['Valor neto'])
+    expected = predict(features)
+    assert predict(features.to_dict('records')[5]) == pytest.approx(expected[5:6])
+    np.testing.assert_allclose(predict(transformer.to_matrix(features)), expected)
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from app import config
+from app.data_processing import TRMError, convert_trm
+
+
+def records(*rows):
+    return pd.DataFrame(rows, columns=['Creado el', 'Mon.', 'Valor neto'])
+
+
+@pytest.fixture
+def trm_table(database):
+    pd.DataFrame({'Fecha': ['2024-01-01', '2024-01-03', '2024-01-04'], 'TRM': [4000.0, 4100.0, 4200.0]}) \
+        .to_csv(database / config.TRM_NAME, index=False)
+    return database
+
+
+def test_usd_uses_last_trm_published_on_or_before_date(trm_table):
+    data = records((pd.Timestamp('2024-01-01 08:00'), 'USD', 1.0),
+                   (pd.Timestamp('2024-01-02 23:59'), 'USD', 1.0),
+                   (pd.Timestamp('2024-01-03'), 'USD', 2.0),
+                   (pd.Timestamp('2024-01-03'), 'COP', 5.0))
+    assert convert_trm(data)['Valor neto'].tolist() == [4000.0, 4000.0, 8200.0, 5.0]
+
+
+def test_dates_can_come_from_the_index(trm_table):
+    data = records((pd.Timestamp('2024-01-04'), 'USD', 1.0)).set_index('Creado el')
+    assert convert_trm(data)['Valor neto'].tolist() == [4200.0]
+
+
+def test_usd_before_first_trm_raises(trm_table):
+    with pytest.raises(TRMError):
+        convert_trm(records((pd.Timestamp('2023-12-31 23:59'), 'USD', 1.0)))
+
+
+def test_usd_within_max_days_after_last_trm_uses_it(trm_table):
+    last_covered = pd.Timestamp('2024-01-04') + pd.Timedelta(days=config.TRM_MAX_DAYS, hours=23)
+    data = records((last_covered, 'USD', 1.0))
+    assert convert_trm(data)['Valor neto'].tolist() == [4200.0]
+
+
+def test_usd_past_max_days_after_last_trm_raises(trm_table):
+    first_uncovered = pd.Timestamp('2024-01-04') + pd.Timedelta(days=config.TRM_MAX_DAYS + 1)
+    with pytest.raises(TRMError):
+        convert_trm(records((first_uncovered, 'USD', 1.0)))
+
+
+def test_cop_records_do_not_need_trm(trm_table):
+    data = records((pd.Timestamp('2030-01-01'), 'COP', 7.0))
+    assert convert_trm(data)['Valor neto'].tolist() == [7.0]
+
+
+def test_shipped_table_covers_the_billing_history():
+    data = records((pd.Timestamp('2022-01-03'), 'USD', 1.0), (pd.Timestamp('2024-03-04'), 'USD', 1.0))
+    assert (convert_trm(data)['Valor neto'] > 0).all()